@@ -0,0 +1,2 @@
+from .transport import Transport
+from .cache import DiskCache
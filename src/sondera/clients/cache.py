@@ -0,0 +1,225 @@
+"""
+Persistent on-disk cache for HTTP responses
+
+Responses are keyed by URL and stored gzip compressed, one file per URL.
+Each entry expires after a time-to-live that depends on the SMHI period in
+the URL, and stale entries are revalidated with ETag/Last-Modified when the
+server provided them. The total size of the cache is bounded, least recently
+used entries are evicted first.
+
+The time an entry was stored or last revalidated is the modification time of
+its file, and the time it was last read is the access time, set explicitly on
+each read. Revalidating an entry thus only touches the file, without rewriting
+the body.
+
+Writes are atomic (write to a temporary file and rename), so a cache directory
+can be shared between processes, e.g. on a shared volume.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Time-to-live in seconds for each SMHI period type
+DEFAULT_TTL = {'latest-hour': 10 * 60,
+               'latest-day': 60 * 60,
+               'latest-months': 6 * 60 * 60,
+               'corrected-archive': 7 * 24 * 60 * 60}
+
+# Response headers kept in the cache
+_CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+# Fraction of max_size the cache is reduced to when evicting
+_EVICT_TO = 0.9
+
+_period_re = re.compile(r'/period/([\w-]+)/')
+
+
+class DiskCache:
+    """ On-disk HTTP response cache, to be passed to Transport
+
+    Parameters
+    ----------
+    directory : str
+        Directory for the cache files, created if it does not exist.
+    max_size : int
+        Maximum total size of the cache files in bytes, default 1 GB. The directory
+        is scanned only when the size written by this process since the last scan
+        would exceed it, so writes by other processes are counted at the next scan.
+    ttl : dict, optional
+        Time-to-live in seconds per SMHI period ('latest-hour', 'corrected-archive' etc.),
+        updates the values in DEFAULT_TTL.
+    default_ttl : float
+        Time-to-live in seconds for URLs without a period, such as station
+        and parameter metadata. Default one day.
+    compress_level : int
+        gzip compression level for stored bodies.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 max_size: int = 1024 ** 3,
+                 ttl: Dict[str, float] = None,
+                 default_ttl: float = 24 * 60 * 60,
+                 compress_level: int = 6):
+
+        self.directory = os.path.expanduser(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.max_size = max_size
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.default_ttl = default_ttl
+        self.compress_level = compress_level
+
+        # estimate of the total size, from the last scan plus what this process
+        # wrote since. The directory is only scanned when it crosses max_size.
+        self._size_estimate = None
+        self._size_lock = threading.Lock()
+
+    def ttl_for(self, url: str) -> float:
+        """ Time-to-live in seconds for url, based on the period in the url """
+        period_match = _period_re.search(url)
+        if period_match is None:
+            return self.default_ttl
+        return self.ttl.get(period_match.group(1), self.default_ttl)
+
+    def get(self, url: str) -> Optional[Tuple[dict, bytes]]:
+        """ Return (header, body) of the cached entry for url, or None if not cached """
+        path = self._path(url)
+        try:
+            with open(path, 'rb') as f_raw:
+                mtime = os.fstat(f_raw.fileno()).st_mtime
+                with gzip.GzipFile(fileobj=f_raw, mode='rb') as f:
+                    header = json.loads(f.readline())
+                    body = f.read()
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+        if header.get('url') != url:
+            return None
+
+        header['stored'] = mtime
+
+        # atime is used for least recently used eviction, mtime is kept
+        try:
+            os.utime(path, (time.time(), mtime))
+        except FileNotFoundError:
+            pass
+
+        return header, body
+
+    def is_fresh(self, url: str, header: dict) -> bool:
+        """ True if the cached entry is younger than the time-to-live for url """
+        return time.time() - header['stored'] < self.ttl_for(url)
+
+    def set(self, url: str, headers, body: bytes, encoding: str = None):
+        """ Store body and the relevant headers for url """
+        header = {'url': url,
+                  'encoding': encoding,
+                  'headers': {k: headers[k] for k in _CACHED_HEADERS if k in headers}}
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f_raw:
+                with gzip.GzipFile(fileobj=f_raw, mode='wb',
+                                   compresslevel=self.compress_level) as f:
+                    f.write(json.dumps(header).encode() + b'\n')
+                    f.write(body)
+            written = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(url))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._size_lock:
+            if self._size_estimate is None:
+                self._size_estimate = self.size()
+            else:
+                # a replaced entry is counted twice until the next scan
+                self._size_estimate += written
+            if self._size_estimate > self.max_size:
+                self._size_estimate = self._evict()
+
+    def revalidated(self, url: str):
+        """ Mark the entry for url as fresh again, after the server answered 304 Not Modified """
+        try:
+            os.utime(self._path(url))
+        except FileNotFoundError:
+            pass
+
+    def size(self) -> int:
+        """ Total size of the cache files in bytes """
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        """ Remove all cached entries """
+        for path, _, _ in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._size_lock:
+            self._size_estimate = 0
+
+    @staticmethod
+    def to_response(url: str, header: dict, body: bytes) -> requests.Response:
+        """ Build a requests.Response from a cached entry """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = url
+        response.encoding = header.get('encoding')
+        response.headers = CaseInsensitiveDict(header.get('headers', {}))
+        response._content = body
+
+        return response
+
+    def _path(self, url):
+        return os.path.join(self.directory,
+                            hashlib.sha256(url.encode()).hexdigest() + '.gz')
+
+    def _entries(self):
+        """ (path, size, atime) of all cache files """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.gz'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, st.st_size, st.st_atime))
+        return entries
+
+    def _evict(self) -> int:
+        """ Remove least recently used entries if the cache is above max_size,
+        return the remaining total size """
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= self.max_size:
+            return total_size
+
+        # leave some room so the following writes do not scan again right away
+        target_size = self.max_size * _EVICT_TO
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            if total_size <= target_size:
+                break
+
+        return total_size
@@ -114,19 +114,27 @@ class SGULanCodes(Enum):
 # TODO str_pattern doesnt have to be unique, just to find the line in each csv str
 #       Only a few (2-3?) different formats
 
+# dtypes and timestamp_format are used for parsing the use_cols columns. Date and time columns
+# are read as categories, so that each unique value is converted to datetime only once.
 met_obs_patterns = {
     'rep_day': {
         'str_pattern': 'Från Datum Tid (UTC);Till Datum Tid (UTC);Representativt dygn',
         'use_cols': [2, 3, 4],
-        'timestamp_type': 'ref_day'},
+        'dtypes': ['category', 'float64', 'category'],
+        'timestamp_type': 'ref_day',
+        'timestamp_format': '%Y-%m-%d'},
     'rep_month': {
         'str_pattern': 'Från Datum Tid (UTC);Till Datum Tid (UTC);Representativ månad',
         'use_cols': [2, 3, 4],
-        'timestamp_type': 'ref_month'},
+        'dtypes': ['category', 'float64', 'category'],
+        'timestamp_type': 'ref_month',
+        'timestamp_format': '%Y-%m'},
     'date_time': {
         'str_pattern': 'Datum;Tid (UTC)',
         'use_cols': [0, 1, 2, 3],
-        'timestamp_type': 'date_time'}}
+        'dtypes': ['category', 'category', 'float64', 'category'],
+        'timestamp_type': 'date_time',
+        'timestamp_format': '%Y-%m-%d'}}
 
 # CSV structure pattern for archive data
 smhi_parameter_patterns = {
@@ -174,7 +182,9 @@ smhi_parameter_patterns = {
     # HydroObs is different from the MetObs patterns
     ParametersHydroObs.Discharge: {'str_pattern': 'Datum (svensk sommartid);Vattenföring',
                                    'use_cols': [0, 1, 2],
-                                   'timestamp_type': 'date'}}  # NOTE ONLY HYDROOBS CAN HAVE DATE ATM, CHANGE IN CODE NEEDED IF OTHER HAVE IT TOO
+                                   'dtypes': ['category', 'float64', 'category'],
+                                   'timestamp_type': 'date',
+                                   'timestamp_format': '%Y-%m-%d'}}  # NOTE ONLY HYDROOBS CAN HAVE DATE ATM, CHANGE IN CODE NEEDED IF OTHER HAVE IT TOO
 
 
 # SMHI:
@@ -4,23 +4,38 @@ Client for SGU groundwater levels api
 https://www.sgu.se/produkter/geologiska-data/oppna-data/grundvatten-oppna-data/grundvattennivaer-tidsserier/
 
 """
-from typing import Union
+from typing import List, Union
 
 import pandas as pd
-import requests
 
-from ...datatypes import DataSeries, StationType, Coordinate, Station
+from ...datatypes import DataSeries, StationType, Coordinate, Station, compact_dataframe
+from ...geo_utils import transform_xy
 
 from ..parameters import SGULanCodes
 from ..parameters import ParametersGWLevels as Parameters
+from ..transport import Transport, get_default_transport
 
 
 class GroundwaterLevelsClient:
     _api_url = 'https://resource.sgu.se/oppnadata/grundvatten/api/grundvattennivaer'
     _api_url_v1 = 'https://resource.sgu.se/oppnadata/grundvatten/grundvattennivaer'
 
-    def __init__(self):
+    def __init__(self, transport: Transport = None, compact: bool = False, float32: bool = False):
+        """
+        Parameters
+        ----------
+        transport : Transport, optional
+            HTTP transport used for all requests, by default the process wide transport.
+        compact : bool
+            Return aux_data using less memory, repeated strings as categorical,
+            see sondera.datatypes.compact_dataframe.
+        float32 : bool
+            Return observation values, and float aux data with compact=True, as float32.
+        """
         self.Parameters = Parameters
+        self.transport = get_default_transport() if transport is None else transport
+        self.compact = compact
+        self.float32 = float32
         # Returns all observations for a station-id
         self._api_url_template_data = (self._api_url +
                                        '/nivaer/station'
@@ -80,7 +95,7 @@ class GroundwaterLevelsClient:
         api_vars = {'station': station_code}
 
         api_url_data = self._api_url_template_data.format(**api_vars)
-        api_get_data = requests.get(api_url_data)
+        api_get_data = self.transport.get(api_url_data)
         api_data = api_get_data.json()
         data_json = api_data['features'][0]['properties']['Mätningar']
 
@@ -94,6 +109,10 @@ class GroundwaterLevelsClient:
         obs_s = data_df[swe_par_key].copy()
         obs_s.name = parameter.name
         aux_df = data_df[list(set(data_df.keys()) - {swe_par_key})]
+        if self.float32:
+            obs_s = obs_s.astype('float32')
+        if self.compact:
+            aux_df = compact_dataframe(aux_df, self.float32)
 
         # create metadata and station data
         # TODO
@@ -141,7 +160,7 @@ class GroundwaterLevelsClient:
         api_vars = {'lancode': lan_code.value}
 
         api_url_stations = self._api_url_template_stations_lan.format(**api_vars)
-        api_get_stations = requests.get(api_url_stations)
+        api_get_stations = self.transport.get(api_url_stations)
         stations = api_get_stations.json()
 
         stations_df = pd.DataFrame()
@@ -166,6 +185,58 @@ class GroundwaterLevelsClient:
 
         return stations_df
 
+    def get_station_catalog(self,
+                            lan_codes: List[Union[SGULanCodes, str]] = None,
+                            epsg_xy: int = 3006) -> pd.DataFrame:
+        """ Get the stations of all, or the given, län as a single table with one
+        row per station, with WGS84 'latitude' and 'longitude' columns as the
+        station catalogs of MetObs and HydroObs. See station_catalog_from_lan.
+
+        Parameters
+        ----------
+        lan_codes : list of SGULanCodes or str, optional
+            län to get stations for, by default all
+        epsg_xy : int
+            EPSG code of the station coordinates returned by the API, SWEREF 99 TM
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        if lan_codes is None:
+            lan_codes = list(SGULanCodes)
+
+        stations_lan = pd.concat([self.get_all_stations_lan(lan_code) for lan_code in lan_codes], axis=1)
+
+        return self.station_catalog_from_lan(stations_lan, epsg_xy)
+
+    @staticmethod
+    def station_catalog_from_lan(stations_lan: pd.DataFrame, epsg_xy: int = 3006) -> pd.DataFrame:
+        """ Convert stations from get_all_stations_lan, one column per station, to a
+        catalog with one row per station and WGS84 'latitude' and 'longitude'
+
+        Parameters
+        ----------
+        stations_lan : pandas.DataFrame
+            Stations as returned by get_all_stations_lan, or several of these
+            concatenated along the columns
+        epsg_xy : int
+            EPSG code of the 'X' and 'Y' coordinates, SWEREF 99 TM
+
+        Returns
+        -------
+        pandas.DataFrame with column 'id' holding the station code
+        """
+        catalog = stations_lan.T.reset_index(drop=True).rename(columns={'code': 'id'})
+
+        # 'X' is northing and 'Y' is easting, following the Swedish convention
+        longitude, latitude = transform_xy(pd.to_numeric(catalog['Y']), pd.to_numeric(catalog['X']),
+                                           epsg_xy, 4326)
+        catalog['latitude'] = latitude
+        catalog['longitude'] = longitude
+
+        return catalog
+
     def get_all_stations(self):
         # get station info for all lancodes
         raise NotImplementedError
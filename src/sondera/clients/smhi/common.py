@@ -1,11 +1,33 @@
 import json
-import requests
-from ...exceptions import APIError
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def _make_request(api_url, append_404_message=''):
+from requests import RequestException
+
+from ...exceptions import APIError, SonderaError
+from ..transport import get_default_transport
+
+# Errors of single items collected by the batch methods instead of aborting the batch,
+# KeyError and TypeError are raised for unexpected payloads
+_batch_errors = (APIError, SonderaError, RequestException, ValueError, KeyError, TypeError)
+
+
+def _loads_json(content):
+    """ Decode json content (bytes), using orjson if it is installed """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _make_request(api_url, append_404_message='', transport=None):
     """ All SMHI Obs API requests are passed through this function """
-    api_get_result = requests.get(api_url)
+    if transport is None:
+        transport = get_default_transport()
+
+    api_get_result = transport.get(api_url)
 
     if api_get_result.status_code == 200:
         return api_get_result
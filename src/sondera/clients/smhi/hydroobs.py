@@ -6,18 +6,28 @@ Inherits from metobs
 # All dates in the JSON answers are in Unix time stamp. Timezone UTC  # FIXME
 # Allow for returning data in different timezone ?
 
+from typing import Union
+
 import pandas as pd
 
 from .metobs import MetObsClient
 from ..parameters import ParametersHydroObs as Parameters
 from ...datatypes import Coordinate, DataSeries, StationType, Station
+from ..transport import Transport
 
 
 class HydroObsClient(MetObsClient):
     _api_url = 'https://opendata-download-hydroobs.smhi.se/api/version/1.0'
-
-    def __init__(self):
-        super().__init__()
+    _station_type = StationType.HydroStation
+
+    def __init__(self,
+                 transport: Transport = None,
+                 api_parameters: Union[dict, str] = None,
+                 csv_engine: str = 'c',
+                 compact: bool = False,
+                 float32: bool = False):
+        super().__init__(transport, api_parameters, csv_engine=csv_engine,
+                         compact=compact, float32=float32)
         self.Parameters = Parameters
 
     def _create_data_obj(self, aux_df, obs_s, parameter,
@@ -14,29 +14,206 @@ except ImportError:
         raise
 
 import collections
-from io import StringIO
-from typing import Union, List
-
+import datetime
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import codecs
+from io import BytesIO
+from typing import Union, List, Tuple, Dict
+
+import numpy as np
 import pandas as pd
-import requests
-from tqdm import tqdm
 
 from ...exceptions import APIError, SonderaError
-from ...datatypes import DataSeries, StationType, Coordinate, Station
+from ...datatypes import (DataSeries, StationType, Coordinate, Station,
+                          CompactCoordinate, CompactStation, compact_dataframe)
 
 from ..parameters import smhi_parameter_patterns
 from ..parameters import ParametersMetObs as Parameters
 
-from .common import _make_request
+from .common import _make_request, _loads_json, _batch_errors
+from ..transport import Transport, get_default_transport
+
+# Parameter catalogs (api_params_dict) per api url, shared by all clients in the process
+_api_params_cache = {}
+_api_params_lock = threading.Lock()
+
+_csv_engines = ('c', 'pyarrow')
+
+# Periods returning the latest data, smallest first, with the length of data they cover.
+# latest-months covers four months, a margin is kept.
+_latest_periods = (('latest-hour', pd.Timedelta(hours=1)),
+                   ('latest-day', pd.Timedelta(days=1)),
+                   ('latest-months', pd.Timedelta(days=90)))
+# Columns of the station catalog from the parameter resource, see get_station_catalog
+_station_catalog_columns = ['id', 'name', 'owner', 'latitude', 'longitude', 'height',
+                            'active', 'from', 'to', 'updated']
+
+# corrected-archive does not include the latest three months, a margin is kept
+_archive_lag = pd.Timedelta(days=100)
+
+
+def _read_csv_data_pyarrow(csv_buffer, use_cols, csv_columns, dtypes):
+    """ Read csv data section with pyarrow, starting after the header line at the current
+    position of csv_buffer. Same result as the c engine with usecols and dtype.
+
+    The first rows of the data section carry notes ('Tidsutsnitt') in extra columns,
+    so the rows do not all have the same number of fields, which pyarrow requires.
+    Rows are parsed with the number of fields of the last row, and the few rows
+    with another number of fields are cut to that, parsed separately and put back in place.
+    """
+    import pyarrow
+    import pyarrow.csv
+
+    pa_types = {'category': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+                'float64': pyarrow.float64()}
+
+    content = csv_buffer.getbuffer()[csv_buffer.tell():]
+    last_row = bytes(content[-4096:]).rstrip(b'\r\n').rsplit(b'\n', 1)[-1]
+    if not last_row:
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in dtypes.items()})
+    n_fields = max(last_row.count(b';') + 1, max(use_cols) + 1)
+    names = [csv_columns[i] if i in use_cols else f'_{i}' for i in range(n_fields)]
+
+    other_rows = []
+
+    def other_row(row):
+        other_rows.append((row.number, row.text.rstrip('\r')))
+        return 'skip'
+
+    def read(source, invalid_row_handler=None):
+        # single threaded, otherwise row numbers of other_rows are not known
+        return pyarrow.csv.read_csv(
+            source,
+            read_options=pyarrow.csv.ReadOptions(column_names=names, use_threads=False),
+            parse_options=pyarrow.csv.ParseOptions(delimiter=';', quote_char=False,
+                                                   invalid_row_handler=invalid_row_handler),
+            convert_options=pyarrow.csv.ConvertOptions(include_columns=list(dtypes),
+                                                       column_types={name: pa_types[dtype]
+                                                                     for name, dtype in dtypes.items()},
+                                                       strings_can_be_null=True))
+
+    table = read(pyarrow.BufferReader(content), other_row)
+
+    if other_rows:
+        other_content = ''.join(';'.join((row.split(';') + [''] * n_fields)[:n_fields]) + '\n'
+                                for _, row in other_rows)
+        other_table = read(pyarrow.BufferReader(other_content.encode('utf-8')))
+
+        # put the other rows back in place, usually they are the first rows.
+        # Row numbers start at 1 and are increasing.
+        pieces = []
+        csv_start = 0
+        for i, (number, _) in enumerate(other_rows):
+            csv_end = number - 1 - i
+            pieces += [table.slice(csv_start, csv_end - csv_start), other_table.slice(i, 1)]
+            csv_start = csv_end
+        pieces.append(table.slice(csv_start))
+        table = pyarrow.concat_tables(pieces).unify_dictionaries()
+
+    return table.to_pandas()
+
+
+def _to_naive_utc(value) -> pd.Timestamp:
+    """ Timestamp in UTC without timezone as the observations index, tz-aware values are converted """
+    value = pd.Timestamp(value)
+    return value if value.tz is None else value.tz_convert('UTC').tz_localize(None)
+
+
+def _categorical_to_datetime(values: pd.Series, date_format: str) -> np.ndarray:
+    """ Convert categorical date strings to datetime64, parsing each unique value once """
+    categories = values.cat.categories.astype(str)
+    try:
+        dt_categories = pd.to_datetime(categories, format=date_format)
+    except ValueError:
+        dt_categories = pd.to_datetime(categories)
+
+    return _take_categories(values, dt_categories.to_numpy())
+
+
+def _categorical_to_timedelta(values: pd.Series) -> np.ndarray:
+    """ Convert categorical time strings (HH:MM:SS) to timedelta64, parsing each unique value once """
+    td_categories = pd.to_timedelta(values.cat.categories.astype(str))
+
+    return _take_categories(values, td_categories.to_numpy())
+
+
+def _take_categories(values, converted_categories):
+    """ Expand converted categories to the full length of values, missing values as NaT """
+    codes = values.cat.codes.to_numpy()
+    converted = converted_categories[codes]
+    converted[codes == -1] = np.array('NaT', dtype=converted.dtype)
+
+    return converted
+
+
+def _append_observations(data_series, obs_s, aux_df):
+    """ Append observations to data_series in place, keeping categorical aux columns categorical """
+    if obs_s.empty:
+        return
+
+    data_series.data = pd.concat([data_series.data, obs_s])
+
+    if data_series.aux_data is None:
+        data_series.aux_data = aux_df
+    else:
+        aux_data = pd.concat([data_series.aux_data, aux_df])
+        for col, dtype in data_series.aux_data.dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype) and col in aux_data:
+                aux_data[col] = aux_data[col].astype('category')
+        data_series.aux_data = aux_data
+
+    if data_series.end_date is None or obs_s.index.max() > data_series.end_date:
+        data_series.end_date = obs_s.index.max()
 
 
 class MetObsClient:
     _api_url = 'https://opendata-download-metobs.smhi.se/api/version/1.0'
-
-    def __init__(self):
+    _station_type = StationType.MetStation
+
+    def __init__(self,
+                 transport: Transport = None,
+                 api_parameters: Union[dict, str] = None,
+                 csv_engine: str = 'c',
+                 compact: bool = False,
+                 float32: bool = False):
+        """
+        Parameters
+        ----------
+        transport : Transport, optional
+            HTTP transport used for all requests. Pass the same Transport to
+            several clients to share pooled connections between them. By default
+            the process wide transport is used.
+        api_parameters : dict or str, optional
+            Parameter catalog, or path to a snapshot written by save_api_parameters(),
+            used instead of querying the API. By default the catalog is fetched
+            from the API on first use and shared by all clients in the process.
+        csv_engine : str
+            Parser engine for corrected-archive csv data, 'c' (default) or 'pyarrow'.
+            'pyarrow' requires pyarrow to be installed.
+        compact : bool
+            Return data using less memory, quality and other repeated strings in
+            aux_data as categorical and period start/end columns as datetime64,
+            see sondera.datatypes.compact_dataframe.
+        float32 : bool
+            Return observation values, and float aux data with compact=True, as float32.
+        """
 
         self.Parameters = Parameters
 
+        if csv_engine not in _csv_engines:
+            raise ValueError(f"csv_engine must be one of {_csv_engines}, got '{csv_engine}'")
+        if csv_engine == 'pyarrow':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError("csv_engine='pyarrow' requires pyarrow, install with 'pip install pyarrow'")
+        self.csv_engine = csv_engine
+        self.compact = compact
+        self.float32 = float32
+        self.transport = get_default_transport() if transport is None else transport
+
         self._api_url_template_data = (self._api_url +
                                        '/parameter/{parameter}'
                                        '/station/{station}'
@@ -50,13 +227,18 @@ class MetObsClient:
         self._api_url_template_parameter = (self._api_url +
                                             '/parameter/{parameter}.{extension}')
 
-        self.api_params_dict = self.get_api_parameters(print_params=False)
+        if api_parameters is not None:
+            self.load_api_parameters(api_parameters)
 
         # dict with key station id and list of parameters at station
         self.stations = collections.defaultdict(list)
         # dict with stations that include a parameter
         self.parameter_stations = {}
         self.get_all_stations_called = False
+        self._stations_lock = threading.Lock()
+        # available periods per (parameter, station), see get_periods
+        self._periods = {}
+        self._periods_lock = threading.Lock()
 
         self.append_404_message = (". This probably means that either the station, parameter "
                                      "and/or period is not valid. Note that all periods are not "
@@ -93,60 +275,202 @@ class MetObsClient:
         if period.lower() != 'corrected-archive-latest-months':
             return self._api_call_observations(parameter, station, period)
 
-        station_data_ca = self._api_call_observations(parameter,
-                                                      station,
-                                                      'corrected-archive')
+        parameter = self._to_parameter(parameter)
+
+        # station metadata is requested once, and all three requests are made concurrently
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            future_md = executor.submit(self._get_station_metadata, parameter, station)
+            future_ca = executor.submit(self._get_data, parameter, station, 'corrected-archive')
+            future_lm = executor.submit(self._get_data, parameter, station, 'latest-months')
+
+            station_md = future_md.result()
+            obs_s_ca, aux_df_ca, _, _ = future_ca.result()
+            obs_s_lm, aux_df_lm, station_name, md_str = future_lm.result()
 
-        station_data_lm = self._api_call_observations(parameter,
-                                                      station,
-                                                      'latest-months')
         # combine the two data sets, base of data_lm and extend the data series
+        obs_s = obs_s_ca.combine_first(obs_s_lm)
+        obs_s.name = parameter.name
+        aux_df = aux_df_ca.combine_first(aux_df_lm)
+        # combine_first does not keep categoricals with different categories
+        if self.compact:
+            aux_df = compact_dataframe(aux_df, self.float32)
+        elif 'quality' in aux_df:
+            aux_df['quality'] = aux_df['quality'].astype('category')
+
+        return self._create_data_obj(aux_df,
+                                     obs_s,
+                                     parameter,
+                                     station_md,
+                                     station_name,
+                                     md_str)
+
+    def refresh_observations(self, data_series: DataSeries) -> DataSeries:
+        """
+        Append observations newer than the last observation in data_series.
 
-        station_data = station_data_lm  # TODO copy?
-        new_obs_s = station_data_ca.data.combine_first(station_data_lm.data)
-        new_aux_s = station_data_ca.aux_data.combine_first(station_data_lm.aux_data)
-        station_data.data = new_obs_s
-        station_data.aux_data = new_aux_s
+        The smallest period (latest-hour, latest-day or latest-months) that covers
+        the time since the last observation is downloaded, falling back to the next
+        larger period if it is not available for the station. Only data is
+        requested, not station metadata. If the gap is longer than latest-months
+        covers, or data_series has no observations, the full
+        'corrected-archive-latest-months' is downloaded instead.
 
-        return station_data
+        Parameters
+        ----------
+        data_series : DataSeries
+            Observations from get_observations. data, aux_data and end_date are
+            updated in place.
 
-    def _api_call_observations(self,
+        Returns
+        -------
+        The updated DataSeries object
+        """
+        parameter = self._to_parameter(data_series.parameter)
+        station = data_series.station.id
+
+        last_timestamp = data_series.data.index.max()
+
+        latest_data = self._get_latest_data(parameter, station, last_timestamp)
+        if latest_data is not None:
+            obs_s, aux_df, _, _ = latest_data
+        else:
+            new_data = self.get_observations(parameter, station, 'corrected-archive-latest-months')
+            obs_s, aux_df = new_data.data, new_data.aux_data
+
+        if pd.notna(last_timestamp):
+            new_rows = obs_s.index > last_timestamp
+            obs_s = obs_s[new_rows]
+            aux_df = aux_df[new_rows]
+
+        _append_observations(data_series, obs_s, aux_df)
+
+        return data_series
+
+    def get_observations_range(self,
                                parameter: Union[Parameters, int],
                                station: int,
-                               period: str) -> DataSeries:
-        # extension for data
-        api_ext = 'csv' if period.lower() == 'corrected-archive' else 'json'
-        if isinstance(parameter, int):
-            try:
-                parameter = self.Parameters(parameter)
-            except ValueError as error:
-                raise
+                               start: Union[pd.Timestamp, datetime.datetime, str],
+                               end: Union[pd.Timestamp, datetime.datetime, str] = None) -> DataSeries:
+        """
+        Get observations between start and end, choosing the smallest set of
+        periods that covers the range.
 
-        api_vars = {'parameter': parameter.value,
-                    'station': station,
-                    'period': period,
-                    'extension': api_ext}
+        If start is within the latest four months, the smallest of latest-hour,
+        latest-day and latest-months covering it is downloaded (falling back to
+        a larger period if not available for the station). Older start dates
+        require corrected-archive, combined with latest-months if end is more
+        recent than the archive. The result is trimmed to start and end.
 
-        # Get station metadata
-        api_url_station = self._api_url_template_station.format(**api_vars) + '.json'
-        api_get_station = _make_request(api_url_station, self.append_404_message)
-        station_md = api_get_station.json()
+        Parameters
+        ----------
+        parameter : Enum or int
+            parameter Enum or integer id
+        station : int
+            station id
+        start : str, datetime or pandas.Timestamp
+            first timestamp to include, in UTC if naive, tz-aware values are converted to UTC
+        end : str, datetime or pandas.Timestamp, optional
+            last timestamp to include, as start. Default is now.
 
-        # Get data
-        api_url = self._api_url_template_data.format(**api_vars)
-        api_get_result = _make_request(api_url, self.append_404_message)
+        Returns
+        -------
+        DataSeries object
+        """
+        parameter = self._to_parameter(parameter)
 
-        if api_ext == 'json':
-            api_result_json = api_get_result.json()
+        now = pd.Timestamp.now('UTC').tz_localize(None)
+        start = _to_naive_utc(start)
+        end = now if end is None else _to_naive_utc(end)
 
-            obs_s, aux_df, station_name, md_str = self._json_to_dataframe(api_result_json, parameter)
+        station_data = None
+        if now - start <= _latest_periods[-1][1]:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                future_md = executor.submit(self._get_station_metadata, parameter, station)
+                future_data = executor.submit(self._get_latest_data, parameter, station, start)
 
-        else:
-            api_content_decoded = api_get_result.content.decode(encoding='utf-8-sig')
+                station_md = future_md.result()
+                latest_data = future_data.result()
 
-            obs_s, aux_df, station_name, md_str = self._csv_to_dataframe(api_content_decoded, parameter)
+            if latest_data is not None:
+                obs_s, aux_df, station_name, md_str = latest_data
+                station_data = self._create_data_obj(aux_df, obs_s, parameter,
+                                                     station_md, station_name, md_str)
 
-        obs_s.name = parameter.name
+        if station_data is None:
+            period = ('corrected-archive-latest-months' if now - end <= _archive_lag
+                      else 'corrected-archive')
+            station_data = self.get_observations(parameter, station, period)
+
+        in_range = (station_data.data.index >= start) & (station_data.data.index <= end)
+        station_data.data = station_data.data[in_range]
+        station_data.aux_data = station_data.aux_data[in_range]
+
+        return station_data
+
+    def get_observations_batch(self,
+                               observation_requests: List[Tuple[int, Union[Parameters, int], str]],
+                               max_workers: int = 8) -> Tuple[Dict, Dict]:
+        """
+        Get observations for many (station, parameter, period) combinations,
+        running up to max_workers requests concurrently.
+
+        Errors for single items, such as APIError for periods not available at
+        a station, are collected and do not abort the batch.
+
+        Parameters
+        ----------
+        observation_requests : list of tuples
+            (station, parameter, period) for each series, see get_observations
+            for valid values.
+        max_workers : int
+            Maximum number of series fetched concurrently. Each
+            'corrected-archive-latest-months' series makes up to three requests
+            concurrently, the connection pool of the transport is grown to
+            3 * max_workers so that connections are reused.
+
+        Returns
+        -------
+        Tuple of two dicts (results, errors), both keyed by (station, parameter, period),
+        with parameter as Enum. results holds the DataSeries objects, errors
+        holds the exception raised for items that failed.
+        """
+        results = {}
+        errors = {}
+
+        self.transport.ensure_pool_maxsize(3 * max_workers)
+
+        futures = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for station, parameter, period in observation_requests:
+                try:
+                    parameter = self._to_parameter(parameter)
+                except ValueError as error:
+                    errors[(station, parameter, period)] = error
+                    continue
+
+                if self._period_unavailable(parameter, station, period):
+                    errors[(station, parameter, period)] = self._period_unavailable_error(station, period)
+                    continue
+
+                future = executor.submit(self.get_observations, parameter, station, period)
+                futures[future] = (station, parameter, period)
+
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except _batch_errors as error:
+                    errors[futures[future]] = error
+
+        return results, errors
+
+    def _api_call_observations(self,
+                               parameter: Union[Parameters, int],
+                               station: int,
+                               period: str) -> DataSeries:
+        parameter = self._to_parameter(parameter)
+
+        station_md = self._get_station_metadata(parameter, station)
+        obs_s, aux_df, station_name, md_str = self._get_data(parameter, station, period)
 
         # create data object (separate function to easily set station type
         # with inheritance
@@ -163,24 +487,112 @@ class MetObsClient:
 
         return station_data
 
-    def _json_to_dataframe(self, api_result_json, parameter):
-        """ parse json data to DataFrame """
-        df_values = pd.DataFrame(api_result_json['value'])
+    def _get_latest_data(self, parameter: Parameters, station: int, since: pd.Timestamp):
+        """ Get data from the smallest of the latest-* periods covering the time since 'since'.
+        Returns obs_s, aux_df, station_name, md_str or None if no period covers it,
+        or since is NaT (no previous data) """
+        if pd.isna(since):
+            return None
 
-        if smhi_parameter_patterns[parameter]['timestamp_type'] in ['date', 'date_time']:
-            df_values['timestamp'] = pd.to_datetime(df_values['date'], unit='ms',
-                                                    origin='unix')  # TODO set timezone
-            df_values = df_values.drop('date', axis=1)
-        elif smhi_parameter_patterns[parameter]['timestamp_type'] == 'ref_day':
-            df_values['timestamp'] = pd.to_datetime(df_values['ref'])  # TODO set timezone # TODO works for month??
-            df_values = df_values.drop('ref', axis=1)
+        gap = pd.Timestamp.now('UTC').tz_localize(None) - since
+
+        for period, coverage in _latest_periods:
+            if gap > coverage:
+                continue
+            try:
+                return self._get_data(parameter, station, period)
+            except APIError as error:
+                # period not available for station, try next
+                if error.status_code != 404:
+                    raise
+
+        return None
+
+    def _to_parameter(self, parameter: Union[Parameters, int]) -> Parameters:
+        """ Return parameter as Enum, raises ValueError for invalid integer ids """
+        if isinstance(parameter, int):
+            parameter = self.Parameters(parameter)
+        return parameter
+
+    def _get_station_metadata(self, parameter: Parameters, station: int) -> dict:
+        """ Get station metadata from the station resource of a parameter """
+        api_url_station = self._api_url_template_station.format(parameter=parameter.value,
+                                                                station=station) + '.json'
+        api_get_station = _make_request(api_url_station, self.append_404_message,
+                                        self.transport)
+        station_md = api_get_station.json()
+
+        # the station resource lists the available periods, cache them for get_periods
+        if 'period' in station_md:
+            with self._periods_lock:
+                self._periods[(parameter, station)] = [p['key'] for p in station_md['period']]
+
+        return station_md
 
-        df_values = df_values.set_index('timestamp')
-        obs_s = df_values['value'].copy()
-        if not pd.api.types.is_numeric_dtype(obs_s):
-            obs_s = pd.to_numeric(obs_s)
+    def _get_data(self, parameter: Parameters, station: int, period: str):
+        """ Get and parse data for a period, returns obs_s, aux_df, station_name, md_str """
+        # avoid a request for periods known to not be available
+        if self._period_unavailable(parameter, station, period):
+            raise self._period_unavailable_error(station, period)
 
-        aux_df = df_values[list(set(df_values.keys()) - {'value'})]
+        # extension for data
+        api_ext = 'csv' if period.lower() == 'corrected-archive' else 'json'
+
+        api_vars = {'parameter': parameter.value,
+                    'station': station,
+                    'period': period,
+                    'extension': api_ext}
+
+        api_url = self._api_url_template_data.format(**api_vars)
+        api_get_result = _make_request(api_url, self.append_404_message, self.transport)
+
+        if api_ext == 'json':
+            api_result_json = _loads_json(api_get_result.content)
+
+            obs_s, aux_df, station_name, md_str = self._json_to_dataframe(api_result_json, parameter)
+
+        else:
+            obs_s, aux_df, station_name, md_str = self._csv_to_dataframe(api_get_result.content, parameter)
+
+        obs_s.name = parameter.name
+        if self.float32:
+            obs_s = obs_s.astype('float32')
+        if self.compact:
+            aux_df = compact_dataframe(aux_df, self.float32)
+
+        return obs_s, aux_df, station_name, md_str
+
+    def _json_to_dataframe(self, api_result_json, parameter):
+        """ parse json data to DataFrame
+
+        Columns are filled directly from the list of values, instead of first
+        building a DataFrame from the row dicts and converting the columns.
+        """
+        values = api_result_json['value'] or []
+
+        if smhi_parameter_patterns[parameter]['timestamp_type'] in ['date', 'date_time']:
+            timestamp_key = 'date'
+            timestamps = pd.to_datetime(np.fromiter((v['date'] for v in values),
+                                                    dtype=np.int64, count=len(values)),
+                                        unit='ms', origin='unix')  # TODO set timezone
+        else:
+            timestamp_key = 'ref'
+            timestamps = pd.to_datetime([v['ref'] for v in values])  # TODO set timezone
+        timestamps.name = 'timestamp'
+
+        # values can be returned as strings
+        obs_s = pd.Series(np.array([v['value'] for v in values], dtype=np.float64),
+                          index=timestamps, name='value')
+
+        aux_keys = [k for k in (values[0] if values else {}) if k not in ('value', timestamp_key)]
+        aux_columns = {}
+        for aux_key in aux_keys:
+            aux_values = [v.get(aux_key) for v in values]
+            if aux_key == 'quality':
+                aux_columns[aux_key] = pd.Categorical(aux_values)
+            else:
+                aux_columns[aux_key] = aux_values
+        aux_df = pd.DataFrame(aux_columns, index=timestamps)
 
         station_name = api_result_json['station']['name']
 
@@ -188,38 +600,48 @@ class MetObsClient:
 
         return obs_s, aux_df, station_name, md_str
 
-    def _csv_to_dataframe(self, api_content_decoded, parameter):
-        # find csv data line
-        csv_data_line = self._find_csv_data_line(api_content_decoded,
-                                                 smhi_parameter_patterns[parameter]['str_pattern'])
+    def _csv_to_dataframe(self, api_content, parameter):
+        """ parse csv data (bytes) to DataFrame
+
+        The data header line is located directly in the bytes. Metadata and station
+        name are taken from the part before it, and only the data section is passed
+        to the csv parser, so the content is not decoded or scanned more than once.
+        """
+        if api_content.startswith(codecs.BOM_UTF8):
+            api_content = api_content[len(codecs.BOM_UTF8):]
+
+        # find start of csv data (the data header)
+        csv_data_start = self._find_csv_data_start(api_content,
+                                                   smhi_parameter_patterns[parameter]['str_pattern'])
 
-        if csv_data_line is None:
+        if csv_data_start is None:
             raise SonderaError(message='String pattern for parsing csv not matched',
                                report_issue=True, issue_messages=[parameter])
 
-        # parse data
-        csv_df = pd.read_csv(StringIO(api_content_decoded),
-                             sep=';',
-                             header=0,
-                             skiprows=csv_data_line,
-                             usecols=smhi_parameter_patterns[parameter]['use_cols'],
-                             index_col=False)
+        # parse data, BytesIO shares the buffer of api_content and is not copied
+        csv_buffer = BytesIO(api_content)
+        csv_buffer.seek(csv_data_start)
+        csv_df = self._read_csv_data(csv_buffer, parameter)
 
         # handle the various formats date and time is provided in
         # TODO might be able to avoid 'timestamp_type' if there is a clear system
         # i.e. if first key is 'Datum', 'Datum (svensk sommartid)', or 'Representativt dygn'
+        timestamp_format = smhi_parameter_patterns[parameter]['timestamp_format']
         if smhi_parameter_patterns[parameter]['timestamp_type'] in ['date_time']:
-            csv_df['timestamp'] = pd.to_datetime(csv_df['Datum'] + ' '
-                                                 + csv_df['Tid (UTC)'])
+            csv_df['timestamp'] = (_categorical_to_datetime(csv_df['Datum'], timestamp_format)
+                                   + _categorical_to_timedelta(csv_df['Tid (UTC)']))
             csv_df = csv_df.drop(['Datum', 'Tid (UTC)'], axis=1)
         elif smhi_parameter_patterns[parameter]['timestamp_type'] in ['date']:
-            csv_df['timestamp'] = pd.to_datetime(csv_df['Datum (svensk sommartid)'])
+            csv_df['timestamp'] = _categorical_to_datetime(csv_df['Datum (svensk sommartid)'],
+                                                           timestamp_format)
             csv_df = csv_df.drop(['Datum (svensk sommartid)'], axis=1)
         elif smhi_parameter_patterns[parameter]['timestamp_type'] in ['ref_day']:
-            csv_df['timestamp'] = pd.to_datetime(csv_df['Representativt dygn'])
+            csv_df['timestamp'] = _categorical_to_datetime(csv_df['Representativt dygn'],
+                                                           timestamp_format)
             csv_df = csv_df.drop(['Representativt dygn'], axis=1)
         elif smhi_parameter_patterns[parameter]['timestamp_type'] in ['ref_month']:
-            csv_df['timestamp'] = pd.to_datetime(csv_df['Representativ månad'])
+            csv_df['timestamp'] = _categorical_to_datetime(csv_df['Representativ månad'],
+                                                           timestamp_format)
             csv_df = csv_df.drop(['Representativ månad'], axis=1)
 
         csv_df = csv_df.set_index('timestamp')
@@ -230,22 +652,37 @@ class MetObsClient:
         # Rename 'Kvalitet' to 'quality' in aux data as in other json data
         aux_df = aux_df.rename({'Kvalitet': 'quality'}, axis=1)
 
-        md_buffer = StringIO(api_content_decoded)
-        md_str = ''
-        for _ in range(csv_data_line):
-            md_str = md_str + md_buffer.readline()
+        md_str = api_content[:csv_data_start].decode('utf-8')
 
         # Read station info, first two lines of csv file
-        csv_sn = pd.read_csv(StringIO(api_content_decoded),
-                             sep=';',
-                             nrows=1,
-                             header=0)
-
         # Station name is not accessible from station .json from met obs api
-        station_name = csv_sn.loc[0]['Stationsnamn']
+        sn_header, sn_values = md_str.split('\n', 2)[:2]
+        station_name = sn_values.split(';')[sn_header.split(';').index('Stationsnamn')]
 
         return obs_s, aux_df, station_name, md_str
 
+    def _read_csv_data(self, csv_buffer, parameter):
+        """ Read csv data section, starting at the header line at the current position of csv_buffer """
+        patterns = smhi_parameter_patterns[parameter]
+
+        header_start = csv_buffer.tell()
+        csv_columns = csv_buffer.readline().decode('utf-8').rstrip('\r\n').split(';')
+        csv_buffer.seek(header_start)
+
+        use_names = [csv_columns[i] for i in patterns['use_cols']]
+        dtypes = dict(zip(use_names, patterns['dtypes']))
+
+        if self.csv_engine == 'pyarrow':
+            csv_buffer.readline()
+            return _read_csv_data_pyarrow(csv_buffer, patterns['use_cols'], csv_columns, dtypes)
+
+        return pd.read_csv(csv_buffer,
+                           sep=';',
+                           header=0,
+                           usecols=patterns['use_cols'],
+                           dtype=dtypes,
+                           index_col=False)
+
     def _create_data_obj(self, aux_df, obs_s, parameter,
                          station_md, station_name, md_str):
         # Get positions, can be several if station moved
@@ -306,7 +743,18 @@ class MetObsClient:
         # Requires many requests to API, not available. call get_all_stations
         # and get pars where station is listed
 
-    def get_all_stations(self):
+    def get_all_stations(self, max_workers: int = 1):
+        """
+        Query the API for the stations of all parameters, and store them in
+        the attributes parameter_stations (parameter: [Station]) and
+        stations (station id: [parameters]).
+
+        Parameters
+        ----------
+        max_workers : int
+            Number of parameters to query concurrently. Default is 1, querying
+            one parameter at a time.
+        """
 
         # build two dicts, one with parameter: [Station] (Station being the class)
         # one with station_id:parameters (parameters just being a list of the enums available)
@@ -314,18 +762,143 @@ class MetObsClient:
         # Requires many requests to API, not available
         # Need to loop over parameters
         # nice to store if station is active or not
-        if not self.get_all_stations_called:
+        from tqdm import tqdm
+
+        with self._stations_lock:
+            if self.get_all_stations_called:
+                return
+
             print('Querying API for all stations and parameters, please wait...')
-            # call get_stations_parameter
-            # Get stations for each parameter
-            for param in tqdm(Parameters):
-                self.parameter_stations[param] = self.get_stations_parameter(param.value)
+            # Get stations for each parameter, results are merged in parameter order
+            # once all requests are done
+            parameter_stations = {}
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(self.get_stations_parameter, param.value): param
+                           for param in self.Parameters}
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    parameter_stations[futures[future]] = future.result()
+
+            for param in self.Parameters:
+                self.parameter_stations[param] = parameter_stations[param]
                 # loop over stations and add to stations dict
                 for st_p in self.parameter_stations[param]:
                     self.stations[st_p.id].append(param)
 
             self.get_all_stations_called = True
 
+    def get_station_catalog(self,
+                            parameters: List[Union[Parameters, int]] = None,
+                            max_workers: int = 1,
+                            as_geodataframe: bool = False) -> pd.DataFrame:
+        """
+        Get the stations of all, or the given, parameters as a single table
+        with one row per station and parameter.
+
+        Columns are id, name, owner, latitude, longitude, height, active, from,
+        to, updated and parameter (integer id). Use stations_from_catalog to
+        create Station objects from the table, and save_station_catalog and
+        load_station_catalog for Parquet snapshots.
+
+        Parameters
+        ----------
+        parameters : list of Enum or int, optional
+            parameters to get stations for, by default all parameters
+        max_workers : int
+            Number of parameters to query concurrently
+        as_geodataframe : bool
+            Return a geopandas.GeoDataFrame with point geometries (EPSG:4326)
+
+        Returns
+        -------
+        pandas.DataFrame or geopandas.GeoDataFrame
+        """
+        if parameters is None:
+            parameters = list(self.Parameters)
+        parameters = [self._to_parameter(p) for p in parameters]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            catalogs = list(executor.map(self._get_station_catalog_parameter, parameters))
+
+        catalog = pd.concat(catalogs, ignore_index=True)
+        for col in ['from', 'to', 'updated']:
+            catalog[col] = pd.to_datetime(catalog[col], unit='ms', origin='unix')
+
+        if as_geodataframe:
+            import geopandas
+            catalog = geopandas.GeoDataFrame(catalog,
+                                             geometry=geopandas.points_from_xy(x=catalog['longitude'],
+                                                                               y=catalog['latitude']),
+                                             crs=4326)
+
+        return catalog
+
+    def _get_station_catalog_parameter(self, parameter: Parameters) -> pd.DataFrame:
+        """ Stations of one parameter as DataFrame, with timestamps as posix ms """
+        api_url_parameter = self._api_url_template_parameter.format(parameter=parameter.value,
+                                                                    extension='json')
+        api_get_parameter = _make_request(api_url_parameter, self.append_404_message,
+                                          self.transport)
+        parameter_response = _loads_json(api_get_parameter.content)
+
+        catalog = pd.DataFrame.from_records(parameter_response['station'],
+                                            columns=_station_catalog_columns)
+        catalog['parameter'] = parameter.value
+
+        return catalog
+
+    def stations_from_catalog(self, catalog: pd.DataFrame,
+                              compact: bool = False) -> Dict[int, Union[Station, CompactStation]]:
+        """
+        Create Station objects from a station catalog (see get_station_catalog).
+
+        Parameters
+        ----------
+        catalog : pandas.DataFrame
+            station catalog, or a selection of its rows
+        compact : bool
+            Create immutable, hashable CompactStation objects, which use
+            less memory than Station objects
+
+        Returns
+        -------
+        dict of station id to Station, one Station for each unique station id
+        """
+        catalog = catalog.drop_duplicates('id')
+        station_class, coordinate_class = ((CompactStation, CompactCoordinate) if compact
+                                           else (Station, Coordinate))
+
+        stations = {}
+        for st in catalog.to_dict('records'):
+            height = None if pd.isna(st['height']) else st['height']
+            active_period = [st['from'], st['to']]
+            stations[st['id']] = station_class(name=st['name'],
+                                               id=st['id'],
+                                               agency=st['owner'],
+                                               position=coordinate_class(y=st['latitude'],
+                                                                         x=st['longitude'],
+                                                                         z=height,
+                                                                         epsg_xy=4326,
+                                                                         epsg_z=5613),
+                                               station_type=self._station_type,
+                                               active_station=st['active'],
+                                               active_period=(tuple(active_period) if compact
+                                                              else active_period),
+                                               last_updated=st['updated'],
+                                               station_info={})
+
+        return stations
+
+    @staticmethod
+    def save_station_catalog(catalog: pd.DataFrame, path: str):
+        """ Save a station catalog as Parquet snapshot, requires pyarrow.
+        Geometries of a GeoDataFrame are not saved. """
+        pd.DataFrame(catalog.drop(columns='geometry', errors='ignore')).to_parquet(path)
+
+    @staticmethod
+    def load_station_catalog(path: str) -> pd.DataFrame:
+        """ Load a station catalog saved with save_station_catalog, requires pyarrow """
+        return pd.read_parquet(path)
+
     def get_stations_parameter(self, parameter):
         # Get stations where parameter is available
         # https://opendata.smhi.se/apidocs/metobs/parameter.html
@@ -334,7 +907,8 @@ class MetObsClient:
 
         api_url_parameter = self._api_url_template_parameter.format(parameter=parameter,
                                                                     extension='json')
-        api_get_parameter = _make_request(api_url_parameter, self.append_404_message)
+        api_get_parameter = _make_request(api_url_parameter, self.append_404_message,
+                                          self.transport)
         parameter_response = api_get_parameter.json()
 
         # loop over stations that have this parameter
@@ -347,55 +921,132 @@ class MetObsClient:
                                                 z=st['height'],
                                                 epsg_xy=4326,
                                                 epsg_z=5613),
-                            station_type=StationType.MetStation,
+                            station_type=self._station_type,
                             active_station=st['active'],
                             active_period=[pd.to_datetime(st['from'], unit='ms',
                                                           origin='unix'),
                                            pd.to_datetime(st['to'], unit='ms',
                                                           origin='unix')],
                             last_updated=pd.to_datetime(st['updated'], unit='ms',
-                                                        origin='unix'))
+                                                        origin='unix'),
+                            station_info={})
             stations.append(st_so)
 
         return stations
 
-    def get_periods(self):
-        # get available periods for parameter and station
-        pass
+    def get_periods(self, parameter: Union[Parameters, int], station: int) -> List[str]:
+        """
+        Get the periods available for a parameter and station, such as
+        'latest-day' or 'corrected-archive'.
+
+        Periods are read from the station resource, and cached per parameter
+        and station. The cache is also filled when getting observations.
+
+        Parameters
+        ----------
+        parameter : Enum or int
+            parameter Enum or integer id
+        station : int
+            station id
+
+        Returns
+        -------
+        list of period names
+        """
+        parameter = self._to_parameter(parameter)
+
+        with self._periods_lock:
+            periods = self._periods.get((parameter, station))
+        if periods is None:
+            self._get_station_metadata(parameter, station)
+            with self._periods_lock:
+                periods = self._periods.get((parameter, station), [])
+
+        return list(periods)
+
+    def _period_unavailable(self, parameter: Parameters, station: int, period: str) -> bool:
+        """ True if period is known (cached) to not be available, without querying the API """
+        with self._periods_lock:
+            periods = self._periods.get((parameter, station))
+        if periods is None:
+            return False
+
+        if period.lower() == 'corrected-archive-latest-months':
+            return not {'corrected-archive', 'latest-months'}.issubset(periods)
+        return period.lower() not in periods
+
+    def _period_unavailable_error(self, station: int, period: str) -> APIError:
+        """ APIError as for a 404 response, for periods known to not be available """
+        return APIError(404, f'Period {period} not available for station {station}'
+                             + self.append_404_message)
 
     def get_parameters(self, parameter_ids: List[int] = None):
         # return all enums or a limited enums based on integer id
         pass
 
     @staticmethod
-    def _find_csv_data_line(api_content_decoded, str_pattern):
-        """ Find first line of data (i.e. the data header) for .csv type returns
+    def _find_csv_data_start(api_content, str_pattern):
+        """ Find byte offset of first line of data (i.e. the data header) for .csv type returns
         Line is matched with str_pattern, which varies across parameters
         Note that line numbers varies for the same parameters as well """
+        pattern = str_pattern.encode('utf-8')
+
+        if api_content.startswith(pattern):
+            return 0
+
+        line_start = api_content.find(b'\n' + pattern)
+        # if not found, str was not found
+        if line_start == -1:
+            return None
+
+        return line_start + 1
+
+    @property
+    def api_params_dict(self) -> collections.OrderedDict:
+        """ Parameter information from API, fetched on first use """
+        with _api_params_lock:
+            api_params = _api_params_cache.get(self._api_url)
+        if api_params is None:
+            api_params = self.get_api_parameters(print_params=False)
+        return api_params
+
+    @api_params_dict.setter
+    def api_params_dict(self, api_params):
+        with _api_params_lock:
+            _api_params_cache[self._api_url] = api_params
+
+    def load_api_parameters(self, api_parameters: Union[dict, str]):
+        """ Set the parameter catalog from a dict or a snapshot file, without querying the API
+
+        Parameters
+        ----------
+        api_parameters : dict or str
+            dict as returned by get_api_parameters(), or path to a json snapshot
+            written by save_api_parameters()
+        """
+        if not isinstance(api_parameters, dict):
+            with open(api_parameters, encoding='utf-8') as f:
+                api_parameters = json.load(f)
+
+        v_params = {int(k): v for k, v in api_parameters.items()}
+        self.api_params_dict = collections.OrderedDict(sorted(v_params.items()))
 
-        line_data_start = 0
-        try:
-            with StringIO(api_content_decoded) as csv_data:
-                for line in csv_data:
-                    if line.startswith(str_pattern):
-                        return line_data_start
-                    line_data_start += 1
-                # if loop finishes without returning, str was not found
-                return None
-        except TypeError as e:
-            print(e)
-            raise
+    def save_api_parameters(self, path: str):
+        """ Save the parameter catalog as a json snapshot, to be used with load_api_parameters() """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.api_params_dict, f, ensure_ascii=False, indent=1)
 
     def get_api_parameters(self, print_params=True):
         """ Return parameter information from API """
         api_url_version = self._api_url + '.json'
-        api_get_version = requests.get(api_url_version)
+        api_get_version = _make_request(api_url_version, transport=self.transport)
 
         v_resource = api_get_version.json()['resource']
         v_params = {int(vr['key']): {'title': vr['title'], 'summary': vr['summary']} for vr in v_resource}
 
 
         v_params = collections.OrderedDict(sorted(v_params.items()))  # noqa
+        self.api_params_dict = v_params
 
         if print_params:
             for vpk, vpi in v_params.items():
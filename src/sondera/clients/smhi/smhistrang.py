@@ -11,21 +11,62 @@ Todo:
 Multipoint
 
 """
-from typing import Union
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Hashable, List, Tuple, Union
 import datetime
+import time
 
+import numpy as np
 import pandas as pd
+from requests import RequestException
 
 from ..parameters import ParametersStrang as Parameters
-from .common import _make_request
+from .common import _make_request, _batch_errors
+from ...datatypes import Coordinate
+from ...geo_utils import StationIndex
+from ...exceptions import APIError
+from ..transport import Transport, get_default_transport
+
+# Seconds to wait before the first retry of a failed request, doubled for each retry
+_retry_backoff = 1.0
+
+# Index of the model grid points per api url, shared by all clients in the process
+_grid_cache = {}
+_grid_lock = threading.Lock()
 
 
 class StrangClient:
     # Fixed to version 1
     _api_url = 'https://opendata-download-metanalys.smhi.se/api/category/strang1g/version/1/geotype'
 
-    def __init__(self):
+    def __init__(self,
+                 transport: Transport = None,
+                 snap_to_grid: bool = False,
+                 cache_size: int = 1024):
+        """
+        Parameters
+        ----------
+        transport : Transport, optional
+            HTTP transport used for all requests, by default the process wide transport.
+        snap_to_grid : bool
+            Request data for the nearest point of the Strång model grid instead
+            of the coordinates passed, so points in the same grid cell share one
+            request and cache entry. The grid points are downloaded once per
+            process on first use. Points further than the grid spacing from
+            the grid are requested as passed.
+        cache_size : int
+            Number of responses kept in memory and reused by later requests for
+            the same lon, lat (grid point with snap_to_grid), parameter,
+            interval and date window. 0 disables the cache.
+        """
         self.Parameters = Parameters
+        self.transport = get_default_transport() if transport is None else transport
+        self.snap_to_grid = snap_to_grid
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
         self._api_url_template_point = (self._api_url +
                                         '/point/lon/{longitude}'
                                         '/lat/{latitude}'
@@ -42,6 +83,9 @@ class StrangClient:
                        date_from: Union[pd.Timestamp, datetime.datetime, str],
                        date_to: Union[pd.Timestamp, datetime.datetime, str],
                        agg_interval: str,
+                       window: Union[str, pd.Timedelta, None] = 'YS',
+                       max_workers: int = 4,
+                       retries: int = 2,
                        ) -> pd.Series:
         """
         Get Strång data for a single latitude-longitude coordinate.
@@ -60,6 +104,18 @@ class StrangClient:
             Retrieve data up to this datetime.
         agg_interval : str
             Aggregation interval. Valid values are 'hourly', 'daily' and 'monthly'.
+        window : str or pandas.Timedelta, optional
+            Date ranges longer than window are split into windows, requested in
+            parallel. A pandas frequency, by default 'YS' splitting at the start of
+            each calendar year, or a length such as '90D'. Windows start at the
+            start of a day for agg_interval 'daily' and of a month for 'monthly',
+            so no aggregated value is split between windows. None requests the
+            full range at once.
+        max_workers : int
+            Maximum number of windows requested concurrently.
+        retries : int
+            Number of times a window is requested again after a timeout,
+            connection error or server error.
 
         Returns
         -------
@@ -72,44 +128,205 @@ class StrangClient:
         https://opendata.smhi.se/apidocs/strang/
         """
 
-        if isinstance(parameter, int):
-            try:
-                parameter = self.Parameters(parameter)
-            except ValueError as error:
-                raise
-
-        # format date string if passed time is not string
-        # "UTC. For example 2020-01-02T10:00:00Z"
-        # TODO support timezone, strftime now doesnt do this correctly if datetime is localized?
-        # datetimeobject.isoformat() ?
-        if isinstance(date_from, str):
-            date_from_f = date_from
-        else:
-            date_from_f = date_from.strftime('%Y-%m-%dT%H:%M:%SZ')
+        parameter = self._to_parameter(parameter)
 
-        if isinstance(date_to, str):
-            date_to_f = date_to
-        else:
-            date_to_f = date_to.strftime('%Y-%m-%dT%H:%M:%SZ')
+        windows = _split_date_range(date_from, date_to, window, agg_interval)
+
+        if len(windows) == 1:
+            return self._get_data_point_window(parameter, lon, lat, *windows[0],
+                                               agg_interval, retries)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            window_series = list(executor.map(
+                lambda w: self._get_data_point_window(parameter, lon, lat, *w,
+                                                      agg_interval, retries),
+                windows))
+
+        data_series = pd.concat(window_series).sort_index()
+
+        return data_series
+
+    def _get_data_point_window(self, parameter, lon, lat, date_from, date_to, agg_interval, retries):
+        """ Request a single date range, retrying on timeouts, connection and server errors.
+        Responses are cached by lon, lat, parameter, interval and date range. """
+        if self.snap_to_grid:
+            lon, lat = self.nearest_grid_point(lon, lat)
+
+        cache_key = (lon, lat, parameter, agg_interval, _format_date(date_from), _format_date(date_to))
+        with self._cache_lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key].copy()
 
         api_vars = {'parameter': parameter.value,
                     'longitude': lon,
                     'latitude': lat,
-                    'from': date_from_f,
-                    'to': date_to_f,
+                    'from': _format_date(date_from),
+                    'to': _format_date(date_to),
                     'interval': agg_interval}
 
         # Get data
         api_url = self._api_url_template_point.format(**api_vars)
-        api_get_result = _make_request(api_url)
+        for attempt in range(retries + 1):
+            try:
+                api_get_result = _make_request(api_url, transport=self.transport)
+                break
+            except (APIError, RequestException) as error:
+                server_error = not isinstance(error, APIError) or error.status_code >= 500
+                if not server_error or attempt == retries:
+                    raise
+                time.sleep(_retry_backoff * 2 ** attempt)
 
         api_df = pd.DataFrame(api_get_result.json())
         api_df['datetime'] = pd.to_datetime(api_df['date_time'])
         data_series = api_df.set_index('datetime')['value']
         data_series.name = parameter.name
 
+        if self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[cache_key] = data_series.copy()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
         return data_series
 
+    def get_grid(self) -> pd.DataFrame:
+        """ Points of the Strång model grid, with columns 'longitude' and 'latitude',
+        downloaded once per process """
+        return self._get_grid_index()[0].catalog
+
+    def nearest_grid_point(self, lon: float, lat: float) -> Tuple[float, float]:
+        """ (lon, lat) of the grid point nearest to lon, lat, or lon, lat unchanged
+        if it is further from the grid than the grid spacing, e.g. outside the model area """
+        grid_index, grid_spacing = self._get_grid_index()
+        nearest = grid_index.query(Coordinate(y=lat, x=lon, epsg_xy=4326), k=1)
+        if nearest.empty or nearest['distance'].iloc[0] > grid_spacing:
+            return lon, lat
+
+        return float(nearest['longitude'].iloc[0]), float(nearest['latitude'].iloc[0])
+
+    def _get_grid_index(self) -> Tuple[StationIndex, float]:
+        """ StationIndex of the grid points and the grid spacing in meters """
+        with _grid_lock:
+            grid = _grid_cache.get(self._api_url)
+            if grid is None:
+                api_get_result = _make_request(self._api_url + '/multipoint.json',
+                                               transport=self.transport)
+                coordinates = np.asarray(api_get_result.json()['coordinates'], dtype='float64')
+                grid_index = StationIndex(pd.DataFrame(coordinates.reshape(-1, 2),
+                                                       columns=['longitude', 'latitude']))
+
+                # median distance to the nearest other point, of a sample of points
+                sample = grid_index.catalog.iloc[::max(len(grid_index) // 100, 1)]
+                neighbour_distances = [
+                    grid_index.query(Coordinate(y=point.latitude, x=point.longitude, epsg_xy=4326),
+                                     k=2)['distance'].iloc[-1]
+                    for point in sample.itertuples()]
+                grid_spacing = float(np.median(neighbour_distances))
+
+                grid = _grid_cache[self._api_url] = (grid_index, grid_spacing)
+
+        return grid
+
+    def clear_cache(self):
+        """ Remove all cached responses """
+        with self._cache_lock:
+            self._cache.clear()
+
+    def get_data_points(self,
+                        parameter: Union[Parameters, int, List[Union[Parameters, int]]],
+                        points: Union[List[Tuple[float, float]], Dict[Hashable, Tuple[float, float]]],
+                        date_from: Union[pd.Timestamp, datetime.datetime, str],
+                        date_to: Union[pd.Timestamp, datetime.datetime, str],
+                        agg_interval: str,
+                        max_workers: int = 8,
+                        ) -> Tuple[pd.DataFrame, Dict]:
+        """
+        Get Strång data for many latitude-longitude coordinates and parameters,
+        running up to max_workers requests concurrently.
+
+        Errors for single points, such as points outside the Strång model area,
+        are collected and do not abort the batch.
+
+        Parameters
+        ----------
+        parameter : int, ParametersStrang enum or list of these
+            The parameter(s) for the radiation data type.
+        points : list of (lon, lat) tuples or dict of site: (lon, lat)
+            Coordinates in decimal degrees. Columns of the result are named by
+            the dict keys, or by the position in the list.
+        date_from : str, datetime or pandas.Timestamp
+            Retrieve data starting from this datetime.
+        date_to : str, datetime or pandas.Timestamp
+            Retrieve data up to this datetime.
+        agg_interval : str
+            Aggregation interval. Valid values are 'hourly', 'daily' and 'monthly'.
+        max_workers : int
+            Maximum number of requests made concurrently, the connection pool of
+            the transport is grown to this size so that connections are reused.
+
+        Returns
+        -------
+        Tuple (data, errors). data is a pandas DataFrame indexed by time with one
+        column per site, with MultiIndex columns (parameter name, site) when a
+        list of parameters is passed. errors is a dict keyed by (site, parameter),
+        with parameter as Enum, holding the exception raised for failed requests.
+        """
+        multi_parameter = isinstance(parameter, (list, tuple))
+        parameters = [self._to_parameter(p) for p in (parameter if multi_parameter else [parameter])]
+
+        if not isinstance(points, dict):
+            points = dict(enumerate(points))
+
+        results = {}
+        errors = {}
+
+        # sites with identical coordinates, or in the same grid cell with snap_to_grid, share one request
+        point_sites = collections.defaultdict(list)
+        for site, (lon, lat) in points.items():
+            point_sites[self.nearest_grid_point(lon, lat) if self.snap_to_grid else (lon, lat)].append(site)
+
+        self.transport.ensure_pool_maxsize(max_workers)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # points are already requested concurrently, windows of a point are not
+            futures = {executor.submit(self.get_data_point, param, lon, lat,
+                                       date_from, date_to, agg_interval,
+                                       max_workers=1): ((lon, lat), param)
+                       for param in parameters
+                       for lon, lat in point_sites}
+
+            for future in as_completed(futures):
+                point, param = futures[future]
+                try:
+                    data_series = future.result()
+                except _batch_errors as error:
+                    for site in point_sites[point]:
+                        errors[(site, param)] = error
+                else:
+                    for site in point_sites[point]:
+                        results[(site, param)] = data_series
+
+        # columns in the order of parameters and points, independent of completion order
+        columns = {(param.name, site) if multi_parameter else site: results[(site, param)]
+                   for param in parameters
+                   for site in points
+                   if (site, param) in results}
+        names = ['parameter', 'site'] if multi_parameter else ['site']
+
+        if columns:
+            data = pd.concat(columns, axis=1, names=names)
+        else:
+            data = pd.DataFrame(index=pd.DatetimeIndex([], name='datetime'),
+                                columns=pd.MultiIndex.from_tuples([], names=names)
+                                if multi_parameter else pd.Index([], name='site'))
+
+        return data, errors
+
+    def _to_parameter(self, parameter: Union[Parameters, int]) -> Parameters:
+        """ Parameters Enum from Enum or int """
+        return parameter if isinstance(parameter, Parameters) else self.Parameters(parameter)
+
     def get_data_multipoint(self):
         raise NotImplementedError # requires xarray heavy dependence
 
@@ -118,3 +335,44 @@ class StrangClient:
         # Resample timestamps to hourly if provided with higher freq
         raise NotImplementedError  # requires xarray heavy dependence
 
+
+def _format_date(date: Union[pd.Timestamp, datetime.datetime, str]) -> str:
+    """ Format date for the API, "UTC. For example 2020-01-02T10:00:00Z", strings are passed as is """
+    # TODO support timezone, strftime now doesnt do this correctly if datetime is localized?
+    # datetimeobject.isoformat() ?
+    if isinstance(date, str):
+        return date
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _split_date_range(date_from, date_to, window, agg_interval) -> List[Tuple]:
+    """ Split date_from - date_to into consecutive windows at the boundaries of the
+    frequency window, moved to the start of the hour, day ('daily') or month ('monthly').
+    Windows end one hour before the next one starts, so they do not overlap.
+    Ranges without a boundary are returned unchanged. """
+    if window is None:
+        return [(date_from, date_to)]
+
+    start = _to_utc(date_from)
+    end = _to_utc(date_to)
+
+    boundaries = pd.date_range(start.floor('D'), end, freq=window).floor('h')
+    if agg_interval == 'daily':
+        boundaries = boundaries.floor('D')
+    elif agg_interval == 'monthly':
+        boundaries = boundaries.floor('D') - pd.to_timedelta(boundaries.day - 1, unit='D')
+    boundaries = boundaries[(boundaries > start) & (boundaries <= end)].unique()
+
+    if len(boundaries) == 0:
+        return [(date_from, date_to)]
+
+    window_starts = [start, *boundaries]
+    window_ends = [*(boundaries - pd.Timedelta(hours=1)), end]
+
+    return list(zip(window_starts, window_ends))
+
+
+def _to_utc(date: Union[pd.Timestamp, datetime.datetime, str]) -> pd.Timestamp:
+    """ tz-aware UTC Timestamp, naive dates are taken as UTC as by the API """
+    date = pd.Timestamp(date)
+    return date.tz_localize('UTC') if date.tz is None else date.tz_convert('UTC')
@@ -0,0 +1,144 @@
+"""
+Shared HTTP transport for the sondera clients
+
+All clients send their requests through a Transport, which holds a pooled
+requests.Session. Connections are kept alive and reused across calls, and
+across clients when the same Transport is passed to several clients.
+By default all clients share one process wide Transport.
+
+Optionally a DiskCache can be attached to the Transport to persist responses
+between runs, see sondera.clients.cache.
+"""
+import threading
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import DiskCache
+
+
+class Transport:
+    """ Pooled HTTP transport used by the API clients
+
+    Parameters
+    ----------
+    pool_connections : int
+        Number of hosts to keep connection pools for.
+    pool_maxsize : int
+        Maximum number of connections kept alive per host. Should be at least
+        the number of threads making concurrent requests, the batch methods of
+        the clients grow it to their number of workers, see ensure_pool_maxsize.
+    timeout : float or tuple of float
+        Timeout in seconds passed to requests, either a single value or a
+        (connect, read) tuple. None waits forever.
+    max_retries : int
+        Number of retries on connection errors, passed to the requests HTTPAdapter.
+    session : requests.Session, optional
+        Use an existing session instead of creating a new one. Adapters of a
+        passed session are left untouched.
+    cache : DiskCache, optional
+        Cache successful GET responses on disk. Fresh entries are returned
+        without a request, stale entries are revalidated with the server.
+    """
+
+    def __init__(self,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 10,
+                 timeout: Union[float, Tuple[float, float], None] = (10, 120),
+                 max_retries: int = 0,
+                 session: Optional[requests.Session] = None,
+                 cache: Optional[DiskCache] = None):
+
+        self.timeout = timeout
+        self.cache = cache
+
+        # adapter settings, None for a passed session whose adapters are left untouched
+        self._adapter_args = None
+        self._adapter_lock = threading.Lock()
+
+        if session is None:
+            session = requests.Session()
+            self._adapter_args = {'pool_connections': pool_connections,
+                                  'pool_maxsize': pool_maxsize,
+                                  'max_retries': max_retries}
+            self._mount_adapter(session)
+
+        self.session = session
+
+    def ensure_pool_maxsize(self, pool_maxsize: int):
+        """ Grow the connection pool to keep at least pool_maxsize connections alive
+        per host, called by the clients before making that many concurrent requests.
+        Has no effect if the Transport was created with a session. """
+        with self._adapter_lock:
+            if self._adapter_args is None or self._adapter_args['pool_maxsize'] >= pool_maxsize:
+                return
+            self._adapter_args['pool_maxsize'] = pool_maxsize
+            self._mount_adapter(self.session)
+
+    def _mount_adapter(self, session):
+        adapter = HTTPAdapter(**self._adapter_args)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """ Send a GET request using the pooled session, served from cache if possible """
+        kwargs.setdefault('timeout', self.timeout)
+
+        if self.cache is None:
+            return self.session.get(url, **kwargs)
+
+        cached = self.cache.get(url)
+        if cached is not None:
+            header, body = cached
+            if self.cache.is_fresh(url, header):
+                return self.cache.to_response(url, header, body)
+
+            # conditional request, server answers 304 if the cached body is still valid
+            validators = {}
+            if 'ETag' in header['headers']:
+                validators['If-None-Match'] = header['headers']['ETag']
+            if 'Last-Modified' in header['headers']:
+                validators['If-Modified-Since'] = header['headers']['Last-Modified']
+            kwargs['headers'] = {**validators, **kwargs.get('headers', {})}
+
+        response = self.session.get(url, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            self.cache.revalidated(url)
+            return self.cache.to_response(url, header, body)
+
+        if response.status_code == 200:
+            self.cache.set(url, response.headers, response.content, response.encoding)
+
+        return response
+
+    def close(self):
+        """ Close the session and all pooled connections """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> Transport:
+    """ Return the process wide Transport shared by clients created without one """
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+        return _default_transport
+
+
+def set_default_transport(transport: Transport):
+    """ Replace the process wide Transport used by clients created after this call """
+    global _default_transport
+    with _default_transport_lock:
+        _default_transport = transport
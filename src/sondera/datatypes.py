@@ -1,27 +1,34 @@
 """sondera data types"""
 import datetime
-from dataclasses import dataclass
+import functools
+import sys
+from dataclasses import dataclass, field, replace
 from enum import Enum, auto
-from typing import List, Any, Optional, Union
+from typing import List, Any, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 from .geo_utils import distance_haversine, transform_coordinate
 
 
+# Columns with the start and end of the aggregation period of an observation,
+# posix timestamps in ms from json data and strings from csv data
+_range_columns = ('from', 'to', 'Från Datum Tid (UTC)', 'Till Datum Tid (UTC)')
+
+# __slots__ for the compact data types, dataclass supports slots from python 3.10
+_slots = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
 class StationType(Enum):
     HydroStation = auto()
     MetStation = auto()
     GWStation = auto()
 
 
-@dataclass
-class Coordinate:
-    y: float  # Northing or latitude
-    x: float  # Easting or longitude
-    z: float = None
-    epsg_xy: int = None  # EPSG code for CRS for x,y coordinates
-    epsg_z: int = None  # EPSG code for vertical (z) datum
+class _CoordinateMethods:
+    """ Methods shared by Coordinate and CompactCoordinate """
+    __slots__ = ()
 
     def distance_to(self, other) -> float:
         """ Distance to other Coordinate in meters
@@ -39,11 +46,80 @@ class Coordinate:
     def to_wgs84(self):
         """ Convert the 2D coordinates (x, y) to WGS84 epsg:4326 """
         # HINT: transform_coordinate raises ValueError if epsg_xy is None
-        if self.epsg_xy != 4326:
-            coord_wgs84 = transform_coordinate(self,
-                                               epsg_out=4326)
+        if self.epsg_xy == 4326:
+            return self
+
+        return transform_coordinate(self, epsg_out=4326)
+
+
+@dataclass
+class Coordinate(_CoordinateMethods):
+    y: float  # Northing or latitude
+    x: float  # Easting or longitude
+    z: float = None
+    epsg_xy: int = None  # EPSG code for CRS for x,y coordinates
+    epsg_z: int = None  # EPSG code for vertical (z) datum
+
+    def to_compact(self) -> 'CompactCoordinate':
+        """ Immutable, hashable copy with __slots__ """
+        return CompactCoordinate(y=self.y, x=self.x, z=self.z,
+                                 epsg_xy=self.epsg_xy, epsg_z=self.epsg_z)
+
+
+@dataclass(frozen=True, **_slots)
+class CompactCoordinate(_CoordinateMethods):
+    """ Immutable Coordinate with __slots__, hashable and usable as dict key """
+    y: float  # Northing or latitude
+    x: float  # Easting or longitude
+    z: float = None
+    epsg_xy: int = None  # EPSG code for CRS for x,y coordinates
+    epsg_z: int = None  # EPSG code for vertical (z) datum
+
+    def to_coordinate(self) -> Coordinate:
+        return Coordinate(y=self.y, x=self.x, z=self.z,
+                          epsg_xy=self.epsg_xy, epsg_z=self.epsg_z)
+
+
+@dataclass(frozen=True, eq=False, **_slots)
+class PositionHistory:
+    """ Positions of a station over time stored as arrays, one element per position
+
+    All positions share the CRS epsg_xy and vertical datum epsg_z.
+    """
+    from_dates: np.ndarray  # datetime64
+    to_dates: np.ndarray  # datetime64
+    y: np.ndarray  # Northing or latitude
+    x: np.ndarray  # Easting or longitude
+    z: np.ndarray
+    epsg_xy: int = None
+    epsg_z: int = None
+
+    def __len__(self):
+        return len(self.from_dates)
+
+    @classmethod
+    def from_list(cls, position_history: List[dict]) -> 'PositionHistory':
+        """ From the Station.position_history list of {'from', 'to', 'position'} dicts """
+        positions = [pos['position'] for pos in position_history]
+        first = positions[0] if positions else Coordinate(y=None, x=None)
 
-            return coord_wgs84
+        return cls(from_dates=pd.to_datetime([pos['from'] for pos in position_history]).to_numpy(),
+                   to_dates=pd.to_datetime([pos['to'] for pos in position_history]).to_numpy(),
+                   y=np.array([p.y for p in positions], dtype='float64'),
+                   x=np.array([p.x for p in positions], dtype='float64'),
+                   z=np.array([np.nan if p.z is None else p.z for p in positions], dtype='float64'),
+                   epsg_xy=first.epsg_xy,
+                   epsg_z=first.epsg_z)
+
+    def to_list(self) -> List[dict]:
+        """ As the Station.position_history list of {'from', 'to', 'position'} dicts """
+        return [{'from': pd.Timestamp(from_date),
+                 'to': pd.Timestamp(to_date),
+                 'position': Coordinate(y=float(y), x=float(x),
+                                        z=None if np.isnan(z) else float(z),
+                                        epsg_xy=self.epsg_xy, epsg_z=self.epsg_z)}
+                for from_date, to_date, y, x, z in zip(self.from_dates, self.to_dates,
+                                                       self.y, self.x, self.z)]
 
 
 @dataclass
@@ -60,6 +136,58 @@ class Station:
     station_info: dict[str, Any]
     position_history: Optional[List] = None
 
+    def to_compact(self) -> 'CompactStation':
+        """ Immutable, hashable copy with __slots__ and position history as arrays """
+        position_history = self.position_history
+        if position_history is not None:
+            position_history = PositionHistory.from_list(position_history)
+
+        return CompactStation(name=self.name,
+                              id=self.id,
+                              agency=self.agency,
+                              position=self.position.to_compact(),
+                              station_type=self.station_type,
+                              active_station=self.active_station,
+                              active_period=tuple(self.active_period),
+                              last_updated=self.last_updated,
+                              station_info=self.station_info,
+                              position_history=position_history)
+
+
+@dataclass(frozen=True, **_slots)
+class CompactStation:
+    """ Immutable Station with __slots__ and position history as arrays
+
+    Hashable and usable as dict or cache key, station_info and
+    position_history are not part of equality and hash.
+    """
+    name: str
+    id: int
+    agency: str
+    position: CompactCoordinate
+    station_type: StationType
+    active_station: bool
+    active_period: Tuple[datetime.datetime, datetime.datetime]
+    last_updated: datetime.datetime
+    station_info: dict = field(default=None, compare=False)
+    position_history: Optional[PositionHistory] = field(default=None, compare=False)
+
+    def to_station(self) -> Station:
+        position_history = self.position_history
+        if position_history is not None:
+            position_history = position_history.to_list()
+
+        return Station(name=self.name,
+                       id=self.id,
+                       agency=self.agency,
+                       position=self.position.to_coordinate(),
+                       station_type=self.station_type,
+                       active_station=self.active_station,
+                       active_period=list(self.active_period),
+                       last_updated=self.last_updated,
+                       station_info=self.station_info,
+                       position_history=position_history)
+
 
 @dataclass
 class DataSeries:
@@ -73,3 +201,221 @@ class DataSeries:
     start_date: datetime.datetime
     end_date: datetime.datetime
     aux_data: Optional[pd.DataFrame] = None
+
+    def to_compact(self, float32: bool = False) -> 'DataSeries':
+        """ Copy using less memory, see compact_dataframe
+
+        Parameters
+        ----------
+        float32 : bool
+            Store data and float aux data as float32
+        """
+        data = self.data
+        if float32 and pd.api.types.is_float_dtype(data.dtype):
+            data = data.astype('float32')
+        aux_data = None if self.aux_data is None else compact_dataframe(self.aux_data, float32)
+
+        return replace(self, data=data, aux_data=aux_data)
+
+    def memory_usage(self) -> int:
+        """ Memory used by data and aux_data in bytes, including the index and object values """
+        memory = self.data.memory_usage(index=True, deep=True)
+        if self.aux_data is not None:
+            # the index is shared with data in the clients, counted once
+            memory += self.aux_data.memory_usage(index=False, deep=True).sum()
+
+        return int(memory)
+
+
+def compact_dataframe(df: pd.DataFrame, float32: bool = False) -> pd.DataFrame:
+    """ Convert columns of df to dtypes using less memory
+
+    Period start and end columns ('from', 'to', 'Från Datum Tid (UTC)',
+    'Till Datum Tid (UTC)') are converted to datetime64, quality and other
+    string columns with repeated values to categorical, and float columns
+    optionally to float32.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    float32 : bool
+        Convert float64 columns to float32
+
+    Returns
+    -------
+    pandas.DataFrame, a new DataFrame with the converted columns
+    """
+    columns = {}
+    for col, values in df.items():
+        if col in _range_columns and not pd.api.types.is_datetime64_any_dtype(values.dtype):
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # each unique value is parsed once
+                dt_categories = pd.to_datetime(values.cat.categories.astype(str))
+                values = values.cat.rename_categories(dt_categories).astype(dt_categories.dtype)
+            elif pd.api.types.is_numeric_dtype(values.dtype):
+                values = pd.to_datetime(values, unit='ms', origin='unix')
+            else:
+                values = pd.to_datetime(values)
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.remove_unused_categories()
+        elif pd.api.types.is_object_dtype(values.dtype) or pd.api.types.is_string_dtype(values.dtype):
+            if col == 'quality' or values.nunique() <= len(values) // 2:
+                values = values.astype('category')
+        elif float32 and values.dtype == 'float64':
+            values = values.astype('float32')
+        columns[col] = values
+
+    return pd.DataFrame(columns, index=df.index)
+
+
+class DataPanel:
+    """ Observations of many stations aligned on a shared time index
+
+    Values are stored in one 2-D numpy array of shape (time, station) in column
+    major (Fortran) order, so the values of a station are contiguous. Selecting
+    a time range, a single station or a contiguous range of stations with sel()
+    returns a DataPanel sharing the memory of the original, without copying.
+
+    Use DataPanel.from_data_series to build a panel from DataSeries objects.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        2-D array of shape (len(index), len(stations))
+    index : pandas.DatetimeIndex
+        Time index of the rows of values
+    stations : pandas.DataFrame
+        Station metadata, one row per column of values, indexed by the column key
+    """
+
+    def __init__(self, values: np.ndarray, index: pd.DatetimeIndex, stations: pd.DataFrame):
+        if values.shape != (len(index), len(stations)):
+            raise ValueError(f'values shape {values.shape} does not match index and stations '
+                             f'({len(index)}, {len(stations)})')
+        self.values = values
+        self.index = index
+        self.stations = stations
+
+    @classmethod
+    def from_data_series(cls,
+                         data_series: List[DataSeries],
+                         index: Union[str, pd.DatetimeIndex] = 'union',
+                         freq: str = None,
+                         how: str = 'mean',
+                         keys: List[Any] = None,
+                         dtype='float64') -> 'DataPanel':
+        """ Align DataSeries on a shared time index in one 2-D block
+
+        Parameters
+        ----------
+        data_series : list of DataSeries
+        index : str or pandas.DatetimeIndex
+            'union' of all timestamps, 'intersection' of the timestamps present in
+            all series, or a DatetimeIndex to align on
+        freq : str, optional
+            Resample each series to freq (pandas offset alias, e.g. '1D') with how
+            before aligning
+        how : str
+            Aggregation used for resampling, e.g. 'mean', 'sum', 'max'
+        keys : list, optional
+            Column keys, by default the station ids. Required when several series
+            are from the same station.
+        dtype : str or numpy.dtype
+            dtype of the values, missing values are NaN
+
+        Returns
+        -------
+        DataPanel
+        """
+        if keys is None:
+            keys = [ds.station.id for ds in data_series]
+        if len(set(keys)) != len(keys):
+            raise ValueError('Column keys are not unique, pass unique keys for series of the same station')
+
+        series = [ds.data for ds in data_series]
+        if freq is not None:
+            series = [s.resample(freq).agg(how) for s in series]
+
+        if isinstance(index, str):
+            if index not in ('union', 'intersection'):
+                raise ValueError(f"index must be 'union', 'intersection' or a DatetimeIndex, got '{index}'")
+            indexes = [s.index for s in series]
+            if not indexes:
+                index = pd.DatetimeIndex([], name='timestamp')
+            elif index == 'union':
+                # pairwise union merges sorted indexes, and returns early for equal indexes
+                index = functools.reduce(lambda a, b: a.union(b), indexes)
+            else:
+                index = functools.reduce(lambda a, b: a.intersection(b), indexes)
+            index = index.rename('timestamp')
+
+        values = np.full((len(index), len(series)), np.nan, dtype=dtype, order='F')
+        for col, s in enumerate(series):
+            s_values = s.to_numpy(dtype=dtype, na_value=np.nan)
+            if s.index.equals(index):
+                values[:, col] = s_values
+            else:
+                rows = index.get_indexer(s.index)
+                found = rows >= 0
+                values[rows[found], col] = s_values[found]
+
+        stations = pd.DataFrame.from_records(
+            [{'id': ds.station.id,
+              'name': ds.station.name,
+              'agency': ds.station.agency,
+              'station_type': ds.station.station_type,
+              'y': ds.station.position.y,
+              'x': ds.station.position.x,
+              'epsg_xy': ds.station.position.epsg_xy,
+              'parameter': ds.parameter,
+              'start_date': ds.start_date,
+              'end_date': ds.end_date} for ds in data_series],
+            index=pd.Index(keys, name='key'),
+            columns=['id', 'name', 'agency', 'station_type', 'y', 'x', 'epsg_xy',
+                     'parameter', 'start_date', 'end_date'])
+
+        return cls(values, index, stations)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __len__(self):
+        return len(self.index)
+
+    def sel(self, start=None, end=None, stations=None) -> 'DataPanel':
+        """ Select a time range and stations
+
+        Time ranges, a single station key and contiguous station keys (in
+        column order) return a view sharing memory with this panel. Other
+        station selections are copied.
+
+        Parameters
+        ----------
+        start, end : str or datetime, optional
+            Start and end of the time range, both included
+        stations : key or list of keys, optional
+            Station keys (columns) to select
+
+        Returns
+        -------
+        DataPanel
+        """
+        rows = self.index.slice_indexer(start, end)
+
+        if stations is None:
+            cols = slice(None)
+        else:
+            if not isinstance(stations, (list, tuple, np.ndarray, pd.Index)):
+                stations = [stations]
+            cols = self.stations.index.get_indexer(stations)
+            if (cols < 0).any():
+                raise KeyError(f'Stations not in panel: {list(np.asarray(stations)[cols < 0])}')
+            if len(cols) and (np.diff(cols) == 1).all():
+                cols = slice(cols[0], cols[-1] + 1)
+
+        return DataPanel(self.values[rows, cols], self.index[rows], self.stations.iloc[cols])
+
+    def to_frame(self) -> pd.DataFrame:
+        """ Values as DataFrame with one column per station key """
+        return pd.DataFrame(self.values, index=self.index, columns=self.stations.index, copy=False)
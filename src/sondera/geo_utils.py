@@ -4,22 +4,279 @@ Geographical functions for sondera
 # for type hints and cyclic imports of Coordinate
 from __future__ import annotations
 
-from copy import deepcopy
-from typing import TYPE_CHECKING
+from collections import defaultdict
+from dataclasses import replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, List, Tuple, Union
 
-import geopandas
 import numpy as np
+import pandas as pd
+
+# geopandas, pyproj and scipy are imported in the functions using them,
+# importing sondera does not pay for loading them
 
 if TYPE_CHECKING:
-    from .datatypes import Coordinate
+    from .datatypes import Coordinate, Station
+
+R_EARTH = 6371000  # mean Earth radius in m
+
+
+class StationIndex:
+    """ Spatial index of stations for nearest neighbour and radius queries
+
+    Stations are indexed as points on the unit sphere, where the straight line
+    (chord) distance has the same order as the great circle distance. Queries
+    use a scipy KD-tree when scipy is installed, otherwise a vectorized search
+    over all stations, both well below a millisecond for thousands of stations.
+
+    Parameters
+    ----------
+    catalog : pandas.DataFrame
+        Stations with WGS84 'latitude' and 'longitude' columns, such as the
+        catalog from MetObsClient.get_station_catalog. The catalog of MetObs
+        has one row per station and parameter, use drop_duplicates('id') to
+        index each station once.
+    """
+
+    def __init__(self, catalog: pd.DataFrame):
+        self.catalog = catalog.reset_index(drop=True)
+        self._xyz = _lat_lon_to_xyz(self.catalog['latitude'].to_numpy(dtype='float64'),
+                                    self.catalog['longitude'].to_numpy(dtype='float64'))
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            self._tree = None
+        else:
+            self._tree = cKDTree(self._xyz)
+
+    @classmethod
+    def from_catalogs(cls, *catalogs: pd.DataFrame, sources: Iterable[str] = None) -> StationIndex:
+        """ Build one index from several station catalogs, e.g. of MetObs, HydroObs and SGU
+
+        Parameters
+        ----------
+        catalogs : pandas.DataFrame
+            Station catalogs with 'latitude' and 'longitude' columns, for SGU from
+            GroundwaterLevelsClient.get_station_catalog.
+        sources : list of str, optional
+            Name of each catalog, added as column 'source'.
+        """
+        if sources is not None:
+            catalogs = [c.assign(source=source) for c, source in zip(catalogs, sources)]
+        return cls(pd.concat(catalogs, ignore_index=True))
+
+    @classmethod
+    def from_stations(cls, stations: Iterable[Station]) -> StationIndex:
+        """ Build an index from Station objects, positions are converted to WGS84 """
+        stations = list(stations)
+        positions = transform_coordinates([station.position for station in stations], epsg_out=4326)
+        records = []
+        for station, position in zip(stations, positions):
+            records.append({'id': station.id,
+                            'name': station.name,
+                            'agency': station.agency,
+                            'station_type': station.station_type,
+                            'latitude': position.y,
+                            'longitude': position.x})
+
+        return cls(pd.DataFrame.from_records(records, columns=['id', 'name', 'agency', 'station_type',
+                                                               'latitude', 'longitude']))
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def query(self, coordinate: Coordinate, k: int = 1) -> pd.DataFrame:
+        """ The k nearest stations to coordinate
+
+        Parameters
+        ----------
+        coordinate : Coordinate
+            Coordinate with epsg_xy set, converted to WGS84 if needed
+        k : int
+            Number of stations to return
+
+        Returns
+        -------
+        pandas.DataFrame
+            Rows of the catalog sorted by distance, with column 'distance' in meters
+        """
+        point = _lat_lon_to_xyz(*_to_lat_lon(_check_coordinate(coordinate)))
+        k = min(k, len(self))
+        if k < 1:
+            return self._result(np.array([], dtype=int), np.array([]))
+
+        if self._tree is not None:
+            chord, idx = self._tree.query(point, k=k)
+            return self._result(np.atleast_1d(idx), np.atleast_1d(chord))
+
+        chord_sq = ((self._xyz - point) ** 2).sum(axis=1)
+        idx = np.argpartition(chord_sq, k - 1)[:k]
+        idx = idx[np.argsort(chord_sq[idx])]
+
+        return self._result(idx, np.sqrt(chord_sq[idx]))
+
+    def query_radius(self, coordinate: Coordinate,
+                     radius: float) -> pd.DataFrame:
+        """ All stations within radius meters of coordinate
+
+        Parameters
+        ----------
+        coordinate : Coordinate
+            Coordinate with epsg_xy set, converted to WGS84 if needed
+        radius : float
+            Great circle distance in meters
+
+        Returns
+        -------
+        pandas.DataFrame
+            Rows of the catalog sorted by distance, with column 'distance' in meters
+        """
+        point = _lat_lon_to_xyz(*_to_lat_lon(_check_coordinate(coordinate)))
+        max_chord = 2 * np.sin(min(radius / R_EARTH, np.pi) / 2)
+
+        if self._tree is not None:
+            idx = np.asarray(self._tree.query_ball_point(point, r=max_chord), dtype=int)
+            chord = np.sqrt(((self._xyz[idx] - point) ** 2).sum(axis=1))
+        else:
+            chord_sq = ((self._xyz - point) ** 2).sum(axis=1)
+            idx = np.flatnonzero(chord_sq <= max_chord ** 2)
+            chord = np.sqrt(chord_sq[idx])
+
+        order = np.argsort(chord)
+
+        return self._result(idx[order], chord[order])
+
+    def _result(self, idx, chord):
+        result = self.catalog.iloc[idx].copy()
+        # chord length on the unit sphere to great circle distance
+        result['distance'] = 2 * R_EARTH * np.arcsin(np.clip(chord / 2, 0, 1))
+        return result
+
+
+def _lat_lon_to_xyz(lat, lon):
+    """ WGS84 latitude and longitude in degrees to points on the unit sphere """
+    lat = np.deg2rad(lat)
+    lon = np.deg2rad(lon)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _to_lat_lon(coordinate: Coordinate) -> Tuple[float, float]:
+    """ (latitude, longitude) of a Coordinate in WGS84 """
+    if coordinate.epsg_xy != 4326:
+        coordinate = transform_coordinate(coordinate, epsg_out=4326)
+    return coordinate.y, coordinate.x
+
+
+def _check_coordinate(coordinate):
+    """ Only Coordinate objects are accepted for queries, tuples are ambiguous in
+    (latitude, longitude) or (longitude, latitude) order """
+    if not hasattr(coordinate, 'epsg_xy'):
+        raise TypeError(f'coordinate must be a Coordinate, got {type(coordinate).__name__}')
+    return coordinate
+
+
+def find_nearby_stations(stations: Union[StationIndex, pd.DataFrame],
+                         coordinate: Coordinate,
+                         k: int = None,
+                         radius: float = None) -> pd.DataFrame:
+    """ Find the stations nearest to a coordinate
+
+    Parameters
+    ----------
+    stations : StationIndex or pandas.DataFrame
+        Station index, or a station catalog with 'latitude' and 'longitude'
+        columns. Build a StationIndex once when making many queries.
+    coordinate : Coordinate
+        Coordinate with epsg_xy set, converted to WGS84 if needed
+    k : int, optional
+        Number of nearest stations to return
+    radius : float, optional
+        Return stations within radius meters. If k is also given, the k nearest
+        stations within radius are returned.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Stations sorted by distance, with column 'distance' in meters
+    """
+    if k is None and radius is None:
+        raise ValueError('Either k or radius must be given')
+
+    if not isinstance(stations, StationIndex):
+        stations = StationIndex(stations)
+
+    if radius is None:
+        return stations.query(coordinate, k=k)
+
+    nearby = stations.query_radius(coordinate, radius=radius)
+    if k is not None:
+        nearby = nearby.iloc[:k]
+
+    return nearby
+
+
+def find_stations_in_polygon(stations: pd.DataFrame,
+                             polygons,
+                             crs=None,
+                             id_column: str = 'id',
+                             predicate: str = 'intersects') -> dict:
+    """ Find the stations inside each of many polygons, e.g. catchments
 
+    The stations are reprojected once to the CRS of the polygons and matched
+    to all polygons in one bulk query of a shapely STRtree over the polygons.
 
-def find_nearby_stations():
-    raise NotImplementedError
+    Parameters
+    ----------
+    stations : pandas.DataFrame or geopandas.GeoDataFrame
+        Station catalog. A GeoDataFrame is used with its geometry, a DataFrame
+        needs WGS84 'latitude' and 'longitude' columns.
+    polygons : geopandas.GeoDataFrame, geopandas.GeoSeries or list of shapely Polygons
+        Polygons to select stations with.
+    crs : optional
+        CRS of polygons, required when polygons do not have a CRS set.
+    id_column : str
+        Column of stations with the station id.
+    predicate : str
+        Spatial predicate of the station points and the polygons, 'intersects'
+        includes stations on the polygon boundary, 'within' does not.
+
+    Returns
+    -------
+    dict of polygon index to list of station ids, polygons without stations
+    have an empty list
+    """
+    import geopandas
+
+    if isinstance(polygons, geopandas.GeoDataFrame):
+        polygons = polygons.geometry
+    elif not isinstance(polygons, geopandas.GeoSeries):
+        polygons = geopandas.GeoSeries(polygons)
+
+    if crs is not None:
+        polygons = polygons.set_crs(crs, allow_override=True)
+    if polygons.crs is None:
+        raise ValueError('polygons do not have a CRS, set it with the crs argument')
 
+    if isinstance(stations, geopandas.GeoDataFrame):
+        points = stations.geometry
+    else:
+        points = geopandas.GeoSeries(geopandas.points_from_xy(x=stations['longitude'],
+                                                              y=stations['latitude']),
+                                     crs=4326)
 
-def find_stations_in_polygon():
-    raise NotImplementedError
+    if points.crs is not None and points.crs != polygons.crs:
+        points = points.to_crs(polygons.crs)
+
+    # predicate is evaluated as predicate(point, polygon)
+    point_idx, polygon_idx = polygons.sindex.query(points.values, predicate=predicate)
+
+    station_ids = stations[id_column].to_numpy()[point_idx].tolist()
+    in_polygon = {polygon: [] for polygon in polygons.index}
+    for polygon, station_id in zip(polygons.index[polygon_idx], station_ids):
+        in_polygon[polygon].append(station_id)
+
+    return in_polygon
 
 
 def transform_coordinate(coord_in: Coordinate, epsg_out: int):
@@ -32,22 +289,76 @@ def transform_coordinate(coord_in: Coordinate, epsg_out: int):
 
     Returns
     -------
-
+    New Coordinate with x, y in epsg_out, other attributes copied from coord_in
     """
     if coord_in.epsg_xy is None:
         raise ValueError('coord_in Coordinate object does not have epsg_xy set')
 
-    gs_in = geopandas.GeoSeries(geopandas.points_from_xy(x=[coord_in.x],
-                                                         y=[coord_in.y],
-                                                         crs=coord_in.epsg_xy))
-    gs_out = gs_in.to_crs(epsg=epsg_out)
+    x_out, y_out = _get_transformer(coord_in.epsg_xy, epsg_out).transform(coord_in.x, coord_in.y)
+
+    return replace(coord_in, x=x_out, y=y_out, epsg_xy=epsg_out)
+
+
+def transform_coordinates(coords_in: Iterable[Coordinate], epsg_out: int) -> List[Coordinate]:
+    """ Transform the 2D coordinates of many Coordinate objects with epsg code
+
+    Coordinates are transformed in one call per input CRS.
+
+    Parameters
+    ----------
+    coords_in : list of Coordinate
+        Coordinates with epsg_xy set, can be in different CRS
+    epsg_out : int
+        EPSG code of the output CRS
+
+    Returns
+    -------
+    list of new Coordinate objects in the same order as coords_in
+    """
+    coords_in = list(coords_in)
+    if any(c.epsg_xy is None for c in coords_in):
+        raise ValueError('coords_in Coordinate objects must have epsg_xy set')
+
+    by_epsg = defaultdict(list)
+    for i, coord in enumerate(coords_in):
+        by_epsg[coord.epsg_xy].append(i)
+
+    coords_out = [None] * len(coords_in)
+    for epsg_in, indices in by_epsg.items():
+        x_out, y_out = transform_xy([coords_in[i].x for i in indices],
+                                    [coords_in[i].y for i in indices],
+                                    epsg_in, epsg_out)
+        for i, x, y in zip(indices, x_out.tolist(), y_out.tolist()):
+            coords_out[i] = replace(coords_in[i], x=x, y=y, epsg_xy=epsg_out)
+
+    return coords_out
+
+
+def transform_xy(x, y, epsg_in, epsg_out) -> Tuple[np.ndarray, np.ndarray]:
+    """ Transform arrays of x (easting or longitude) and y (northing or latitude)
+
+    Parameters
+    ----------
+    x, y : array-like
+        Coordinates in epsg_in
+    epsg_in, epsg_out : int or str
+        EPSG code, or other CRS definition accepted by pyproj
+
+    Returns
+    -------
+    tuple of numpy.ndarray (x, y) in epsg_out
+    """
+    x_out, y_out = _get_transformer(epsg_in, epsg_out).transform(np.asarray(x, dtype='float64'),
+                                                                 np.asarray(y, dtype='float64'))
+    return x_out, y_out
+
 
-    coord_out = deepcopy(coord_in)
-    coord_out.x = gs_out.iloc[0].x
-    coord_out.y = gs_out.iloc[0].y
-    coord_out.epsg_xy = epsg_out
+@lru_cache(maxsize=64)
+def _get_transformer(epsg_in, epsg_out):
+    """ Cached pyproj Transformer, always in x, y (longitude, latitude) axis order """
+    import pyproj
 
-    return coord_out
+    return pyproj.Transformer.from_crs(epsg_in, epsg_out, always_xy=True)
 
 
 def distance_euclidean(coord1: Coordinate, coord2: Coordinate) -> float:
@@ -93,7 +404,90 @@ def distance_haversine(coord1: Coordinate, coord2: Coordinate) -> float:
     d_lon = lon2 - lon1
     a = (np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2)
          * np.sin(d_lon / 2) ** 2)
-    c = 2 * np.asin(np.sqrt(a))
+    c = 2 * np.arcsin(np.sqrt(a))
     d = r_earth * c * 1000  # distance in meters
 
     return d
+
+
+def euclidean_distances(points1, points2=None, chunk_size: int = 1024,
+                        dtype='float64') -> np.ndarray:
+    """Pairwise Euclidean distances between two sets of projected coordinates
+
+    Parameters
+    ----------
+    points1 : array-like of shape (n, 2) or list of Coordinate
+        (y, x) coordinates, in a projected CRS with unit meter
+    points2 : array-like of shape (m, 2) or list of Coordinate, optional
+        (y, x) coordinates in the same CRS as points1, by default points1
+    chunk_size : int
+        Number of rows of points1 computed at a time, bounds the memory of
+        intermediate arrays to chunk_size * m elements
+    dtype : str or numpy.dtype
+        dtype of the returned matrix, float32 halves the memory
+
+    Returns
+    -------
+    numpy.ndarray of shape (n, m) with distances in meters
+    """
+    yx1 = _to_points(points1, wgs84=False)
+    yx2 = yx1 if points2 is None else _to_points(points2, wgs84=False)
+
+    distances = np.empty((len(yx1), len(yx2)), dtype=dtype)
+    for start in range(0, len(yx1), chunk_size):
+        chunk = yx1[start:start + chunk_size]
+        distances[start:start + chunk_size] = np.hypot(chunk[:, [0]] - yx2[:, 0],
+                                                       chunk[:, [1]] - yx2[:, 1])
+
+    return distances
+
+
+def haversine_distances(points1, points2=None, chunk_size: int = 1024,
+                        dtype='float64') -> np.ndarray:
+    """Pairwise Haversine distances between two sets of coordinates on Earth
+
+    Parameters
+    ----------
+    points1 : array-like of shape (n, 2) or list of Coordinate
+        (latitude, longitude) in degrees. Coordinate objects are converted
+        to WGS84.
+    points2 : array-like of shape (m, 2) or list of Coordinate, optional
+        (latitude, longitude) in degrees, by default points1
+    chunk_size : int
+        Number of rows of points1 computed at a time, bounds the memory of
+        intermediate arrays to chunk_size * m elements
+    dtype : str or numpy.dtype
+        dtype of the returned matrix, float32 halves the memory
+
+    Returns
+    -------
+    numpy.ndarray of shape (n, m) with distances in meters
+    """
+    lat_lon1 = np.deg2rad(_to_points(points1, wgs84=True))
+    lat_lon2 = lat_lon1 if points2 is None else np.deg2rad(_to_points(points2, wgs84=True))
+
+    lat2 = lat_lon2[:, 0]
+    lon2 = lat_lon2[:, 1]
+    cos_lat2 = np.cos(lat2)
+
+    distances = np.empty((len(lat_lon1), len(lat_lon2)), dtype=dtype)
+    for start in range(0, len(lat_lon1), chunk_size):
+        lat1 = lat_lon1[start:start + chunk_size, [0]]
+        lon1 = lat_lon1[start:start + chunk_size, [1]]
+        a = (np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * cos_lat2
+             * np.sin((lon2 - lon1) / 2) ** 2)
+        distances[start:start + chunk_size] = 2 * R_EARTH * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    return distances
+
+
+def _to_points(points, wgs84: bool) -> np.ndarray:
+    """ (n, 2) float array of (y, x) from an array-like, such as a DataFrame, or a list of Coordinate """
+    # numpy and pandas objects by their values, iterating a DataFrame gives the column names
+    points = np.asarray(points) if hasattr(points, '__array__') else list(points)
+    if len(points) and hasattr(points[0], 'epsg_xy'):
+        if wgs84:
+            points = transform_coordinates(points, epsg_out=4326)
+        points = [(p.y, p.x) for p in points]
+
+    return np.asarray(points, dtype='float64').reshape(-1, 2)
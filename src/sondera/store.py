@@ -0,0 +1,392 @@
+"""
+Local time series store for sondera data, persisted as Parquet files
+
+Series are partitioned by source, parameter and station:
+
+    root/source=<source>/parameter=<parameter>/station=<station>/
+        part-<first timestamp>.parquet   data (column 'value') and aux data, indexed by timestamp
+        metadata.json                    station and series metadata
+
+Appending data writes a new part file instead of rewriting the stored data.
+Reads only open the requested station directories, and date range filters are
+applied to the Parquet row group statistics.
+
+Requires pyarrow.
+"""
+import dataclasses
+import datetime
+import json
+import os
+import shutil
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .clients import parameters as sondera_parameters
+from .clients.sgu import GroundwaterLevelsClient
+from .clients.smhi import HydroObsClient, MetObsClient, StrangClient
+from .datatypes import Coordinate, DataSeries, Station, StationType
+
+_station_type_sources = {StationType.MetStation: 'smhi-metobs',
+                         StationType.HydroStation: 'smhi-hydroobs',
+                         StationType.GWStation: 'sgu-groundwater'}
+_strang_source = 'smhi-strang'
+
+_metadata_file = 'metadata.json'
+
+
+class ParquetStore:
+    """ Store DataSeries and Strång series as partitioned Parquet files
+
+    Parameters
+    ----------
+    root : str
+        Root directory of the store, created if it does not exist.
+    """
+
+    def __init__(self, root: str):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("ParquetStore requires pyarrow, install with 'pip install pyarrow'")
+
+        self.root = os.path.expanduser(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def write(self, data_series: DataSeries, overwrite: bool = False) -> int:
+        """ Store a DataSeries. Only observations newer than the stored data are appended,
+        unless overwrite is True, which replaces the stored series.
+
+        Returns
+        -------
+        Number of observations written
+        """
+        source = _station_type_sources[data_series.station.station_type]
+        frame = _to_frame(data_series.data, data_series.aux_data)
+
+        metadata = {'station': dataclasses.asdict(data_series.station),
+                    'parameter': _parameter_key(data_series.parameter),
+                    'metadata': data_series.metadata,
+                    'start_date': data_series.start_date,
+                    'end_date': data_series.end_date}
+
+        return self._write_frame(source, data_series.parameter.name, data_series.station.id,
+                                 frame, metadata, overwrite)
+
+    def write_strang(self,
+                     data_series: pd.Series,
+                     lon: float,
+                     lat: float,
+                     agg_interval: str,
+                     overwrite: bool = False) -> int:
+        """ Store a Strång series as returned by StrangClient.get_data_point.
+        The series name is used as parameter.
+
+        Returns
+        -------
+        Number of values written
+        """
+        metadata = {'lon': lon, 'lat': lat, 'agg_interval': agg_interval}
+
+        return self._write_frame(_strang_source, data_series.name,
+                                 _strang_station_key(lon, lat, agg_interval),
+                                 _to_frame(data_series), metadata, overwrite)
+
+    def read(self,
+             source: str,
+             parameter: Union[Enum, str],
+             stations: Iterable[Union[int, str]] = None,
+             start: Union[pd.Timestamp, datetime.datetime, str] = None,
+             end: Union[pd.Timestamp, datetime.datetime, str] = None) -> Dict[str, DataSeries]:
+        """ Read stored DataSeries
+
+        Parameters
+        ----------
+        source : str
+            'smhi-metobs', 'smhi-hydroobs' or 'sgu-groundwater'
+        parameter : Enum or str
+            parameter Enum or its name
+        stations : iterable, optional
+            station ids to read, by default all stored stations
+        start, end : str, datetime or pandas.Timestamp, optional
+            only read observations in this range (inclusive)
+
+        Returns
+        -------
+        dict of station id (str) to DataSeries
+        """
+        parameter_name = parameter.name if isinstance(parameter, Enum) else parameter
+        if stations is None:
+            stations = self.list_stations(source, parameter_name)
+
+        data = {}
+        for station in stations:
+            metadata = self._read_metadata(source, parameter_name, station)
+            if metadata is None:
+                continue
+            frame = self._read_frame(source, parameter_name, station, start, end)
+            data[str(station)] = _to_data_series(frame, metadata)
+
+        return data
+
+    def read_strang(self,
+                    parameter: Union[Enum, str],
+                    lon: float,
+                    lat: float,
+                    agg_interval: str,
+                    start: Union[pd.Timestamp, datetime.datetime, str] = None,
+                    end: Union[pd.Timestamp, datetime.datetime, str] = None) -> Optional[pd.Series]:
+        """ Read a stored Strång series, None if nothing is stored. Strång series are
+        indexed by UTC timestamps, naive start and end are taken as UTC. """
+        parameter_name = parameter.name if isinstance(parameter, Enum) else parameter
+        station = _strang_station_key(lon, lat, agg_interval)
+
+        if self._read_metadata(_strang_source, parameter_name, station) is None:
+            return None
+
+        frame = self._read_frame(_strang_source, parameter_name, station,
+                                 _to_utc(start), _to_utc(end))
+        data_series = frame['value']
+        data_series.name = parameter_name
+
+        return data_series
+
+    def list_stations(self, source: str, parameter: Union[Enum, str]) -> List[str]:
+        """ Station ids stored for source and parameter """
+        parameter_name = parameter.name if isinstance(parameter, Enum) else parameter
+        parameter_dir = os.path.join(self.root, f'source={source}', f'parameter={parameter_name}')
+        if not os.path.isdir(parameter_dir):
+            return []
+
+        return sorted(d.split('=', 1)[1] for d in os.listdir(parameter_dir) if d.startswith('station='))
+
+    def last_timestamp(self, source: str, parameter: Union[Enum, str],
+                       station: Union[int, str]) -> Optional[pd.Timestamp]:
+        """ Timestamp of the last stored observation, None if nothing is stored """
+        parameter_name = parameter.name if isinstance(parameter, Enum) else parameter
+        metadata = self._read_metadata(source, parameter_name, station)
+        if metadata is None or metadata['last_timestamp'] is None:
+            return None
+
+        return pd.Timestamp(metadata['last_timestamp'])
+
+    def sync(self,
+             client: Union[MetObsClient, GroundwaterLevelsClient],
+             parameter: Union[Enum, int, str],
+             station: Union[int, str]) -> int:
+        """ Download and store observations newer than the stored data for a station.
+
+        For SMHI MetObs and HydroObs, a station without stored data gets the full
+        'corrected-archive-latest-months' series, otherwise only the smallest period
+        covering the new data is requested (see MetObsClient.refresh_observations).
+        The SGU api always returns the full series, of which only new observations are stored.
+
+        Parameters
+        ----------
+        client : MetObsClient, HydroObsClient or GroundwaterLevelsClient
+        parameter : Enum, int or str
+            parameter as accepted by the client
+        station : int or str
+            station id (SMHI) or station code (SGU)
+
+        Returns
+        -------
+        Number of new observations stored
+        """
+        if isinstance(client, GroundwaterLevelsClient):
+            return self.write(client.get_observations(station, parameter))
+
+        parameter = client._to_parameter(parameter)
+        source = 'smhi-hydroobs' if isinstance(client, HydroObsClient) else 'smhi-metobs'
+
+        last_timestamp = self.last_timestamp(source, parameter, station)
+        if last_timestamp is None:
+            return self.write(client.get_observations(parameter, station,
+                                                      'corrected-archive-latest-months'))
+
+        # refresh the last stored observation, and store what was appended
+        data_series = self.read(source, parameter, [station], start=last_timestamp)[str(station)]
+        n_stored = len(data_series.data)
+        client.refresh_observations(data_series)
+        data_series.data = data_series.data.iloc[n_stored:]
+        data_series.aux_data = data_series.aux_data.iloc[n_stored:]
+
+        return self.write(data_series)
+
+    def sync_strang(self,
+                    client: StrangClient,
+                    parameter: Union[Enum, int],
+                    lon: float,
+                    lat: float,
+                    agg_interval: str,
+                    date_from: Union[pd.Timestamp, datetime.datetime, str],
+                    date_to: Union[pd.Timestamp, datetime.datetime, str] = None) -> int:
+        """ Download and store Strång data for a point, starting from the last stored
+        value or date_from if nothing is stored, up to date_to (default now).
+        Naive date_from and date_to are taken as UTC.
+
+        Returns
+        -------
+        Number of new values stored
+        """
+        parameter = client.Parameters(parameter) if isinstance(parameter, int) else parameter
+        station = _strang_station_key(lon, lat, agg_interval)
+
+        # Strång timestamps are UTC, stored and compared as tz-aware
+        last_timestamp = self.last_timestamp(_strang_source, parameter, station)
+        if last_timestamp is not None:
+            date_from = last_timestamp
+        if date_to is None:
+            date_to = pd.Timestamp.now('UTC').floor('h')
+
+        data_series = client.get_data_point(parameter, lon, lat,
+                                            _to_utc(date_from), _to_utc(date_to),
+                                            agg_interval)
+
+        return self.write_strang(data_series, lon, lat, agg_interval)
+
+    def _station_dir(self, source, parameter_name, station):
+        return os.path.join(self.root, f'source={source}', f'parameter={parameter_name}',
+                            f'station={station}')
+
+    def _read_metadata(self, source, parameter_name, station):
+        try:
+            with open(os.path.join(self._station_dir(source, parameter_name, station), _metadata_file),
+                      encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_frame(self, source, parameter_name, station, frame, metadata, overwrite):
+        station_dir = self._station_dir(source, parameter_name, station)
+
+        if overwrite and os.path.isdir(station_dir):
+            shutil.rmtree(station_dir)
+        os.makedirs(station_dir, exist_ok=True)
+
+        stored_metadata = self._read_metadata(source, parameter_name, station)
+        last_timestamp = None
+        if stored_metadata is not None and stored_metadata['last_timestamp'] is not None:
+            last_timestamp = pd.Timestamp(stored_metadata['last_timestamp'])
+            frame = frame[frame.index > last_timestamp]
+
+        frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        if not frame.empty:
+            part_name = f"part-{frame.index[0].strftime('%Y%m%dT%H%M%S')}.parquet"
+            frame.to_parquet(os.path.join(station_dir, part_name), engine='pyarrow')
+            last_timestamp = frame.index[-1]
+
+        metadata['last_timestamp'] = last_timestamp
+        metadata_path = os.path.join(station_dir, _metadata_file)
+        with open(metadata_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, default=_json_default, ensure_ascii=False)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+        return len(frame)
+
+    def _read_frame(self, source, parameter_name, station, start, end):
+        station_dir = self._station_dir(source, parameter_name, station)
+
+        filters = []
+        if start is not None:
+            filters.append(('timestamp', '>=', pd.Timestamp(start)))
+        if end is not None:
+            filters.append(('timestamp', '<=', pd.Timestamp(end)))
+
+        part_files = sorted(f for f in os.listdir(station_dir) if f.endswith('.parquet'))
+        if not part_files:
+            return pd.DataFrame({'value': pd.Series(dtype='float64')},
+                                index=pd.DatetimeIndex([], name='timestamp'))
+
+        frame = pd.read_parquet([os.path.join(station_dir, f) for f in part_files],
+                                engine='pyarrow',
+                                filters=filters or None,
+                                partitioning=None)
+
+        return frame.sort_index()
+
+
+def _to_frame(data, aux_data=None):
+    """ DataFrame with data as column 'value' and aux_data columns """
+    frame = data.rename('value').to_frame()
+    if aux_data is not None:
+        frame = frame.join(aux_data.drop(columns='value', errors='ignore'))
+    frame.index.name = 'timestamp'
+
+    return frame
+
+
+def _to_data_series(frame, metadata):
+    parameter = _parameter_from_key(metadata['parameter'])
+
+    data = frame['value'].rename(parameter.name)
+    aux_data = frame.drop(columns='value')
+
+    return DataSeries(station=_station_from_dict(metadata['station']),
+                      data=data,
+                      aux_data=aux_data,
+                      parameter=parameter,
+                      metadata=metadata['metadata'],
+                      start_date=_to_timestamp(metadata['start_date']),
+                      end_date=_to_timestamp(metadata['end_date']))
+
+
+def _strang_station_key(lon, lat, agg_interval):
+    return f'{lon}_{lat}_{agg_interval}'
+
+
+def _parameter_key(parameter):
+    return f'{type(parameter).__name__}.{parameter.name}'
+
+
+def _parameter_from_key(parameter_key):
+    enum_name, parameter_name = parameter_key.split('.')
+    return getattr(sondera_parameters, enum_name)[parameter_name]
+
+
+def _json_default(obj):
+    if isinstance(obj, (pd.Timestamp, datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.name
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _to_timestamp(value):
+    return None if value is None else pd.Timestamp(value)
+
+
+def _to_utc(value):
+    """ tz-aware UTC Timestamp, naive values are taken as UTC """
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tz is None else value.tz_convert('UTC')
+
+
+def _station_from_dict(station_dict):
+    position_history = station_dict.get('position_history')
+    if position_history is not None:
+        position_history = [{'from': _to_timestamp(pos['from']),
+                             'to': _to_timestamp(pos['to']),
+                             'position': Coordinate(**pos['position'])}
+                            for pos in position_history]
+
+    active_period = station_dict['active_period']
+    if active_period is not None:
+        active_period = [_to_timestamp(d) for d in active_period]
+
+    return Station(name=station_dict['name'],
+                   id=station_dict['id'],
+                   agency=station_dict['agency'],
+                   position=Coordinate(**station_dict['position']),
+                   station_type=StationType[station_dict['station_type']],
+                   active_station=station_dict['active_station'],
+                   active_period=active_period,
+                   last_updated=_to_timestamp(station_dict['last_updated']),
+                   station_info=station_dict['station_info'],
+                   position_history=position_history)
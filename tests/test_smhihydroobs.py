@@ -39,3 +39,17 @@ def test_csv_patterns(api_client, parameter, station):
     api_data = api_client.get_observations(parameter, station, period)
     assert len(api_data.data) > 0
 
+
+def test_get_all_stations(api_client):
+    api_client.get_all_stations(max_workers=4)
+    assert len(api_client.parameter_stations[ParametersHydroObs.Discharge]) > 0
+    assert ParametersHydroObs.Discharge in api_client.stations[2357]
+
+
+def test_csv_engine_pyarrow():
+    pytest.importorskip('pyarrow')
+    client = HydroObsClient(csv_engine='pyarrow')
+    assert client.csv_engine == 'pyarrow'
+    api_data = client.get_observations(1, 2357, 'corrected-archive')
+    assert len(api_data.data) > 0
+    assert isinstance(api_data.aux_data['quality'].dtype, pd.CategoricalDtype)
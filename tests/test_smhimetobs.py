@@ -4,11 +4,16 @@ Getting obs based on integer parameter id and all periods
 Getting obs based on parameter enum
 Getting csv data correctly parsed (test all parameters)
 """
+import codecs
+import types
+
+import numpy as np
 import pandas as pd
 import pytest
 
 from sondera.clients.smhi import ParametersMetObs
 from sondera.clients.smhi import MetObsClient
+from sondera.exceptions import APIError
 
 
 @pytest.fixture(scope="module")
@@ -32,6 +37,7 @@ def test_get_observations(api_client, parameter, period):
 
     assert not api_data.data.index.duplicated().any()
     assert api_data.data.index.is_monotonic_increasing
+    assert isinstance(api_data.aux_data['quality'].dtype, pd.CategoricalDtype)
 
 
 # test reading metadata from a station with old dates (negative posix)
@@ -90,3 +96,227 @@ def test_csv_patterns(api_client, parameter, station):
     period = 'corrected-archive'
     api_data = api_client.get_observations(parameter, station, period)
     assert len(api_data.data) > 0
+
+
+def test_api_parameters_snapshot(api_client, tmp_path):
+    snapshot_path = tmp_path / 'metobs_parameters.json'
+    api_client.save_api_parameters(snapshot_path)
+
+    client = MetObsClient(api_parameters=snapshot_path)
+    assert client.api_params_dict == api_client.api_params_dict
+
+
+def test_init_without_network(monkeypatch):
+    monkeypatch.setattr('sondera.clients.smhi.metobs._api_params_cache', {})
+    client = MetObsClient(api_parameters={'1': {'title': 'Lufttemperatur', 'summary': ''}})
+    assert list(client.api_params_dict) == [1]
+
+
+@pytest.fixture
+def offline_client(monkeypatch):
+    monkeypatch.setattr('sondera.clients.smhi.metobs._api_params_cache', {})
+    return MetObsClient(api_parameters={'1': {'title': 'Lufttemperatur', 'summary': ''},
+                                        '2': {'title': 'Lufttemperatur', 'summary': ''}})
+
+
+_csv_hour = ('Stationsnamn;Stationsnummer;Stationsnät;Mäthöjd (meter över marken)\n'
+             'Hoburg A;68560;SMHIs stationsnät;2.0\n'
+             '\n'
+             'Parameternamn;Beskrivning;Enhet\n'
+             'Lufttemperatur;momentanvärde, 1 gång/tim;degree celsius\n'
+             '\n'
+             'Datum;Tid (UTC);Lufttemperatur;Kvalitet;;Tidsutsnitt:\n'
+             '2020-01-01;00:00:00;1.5;G;;Kvalitetskontrollerade historiska data\n'
+             '2020-01-01;01:00:00;-0.5;Y;;\n'
+             '2020-01-01;02:00:00;2.0;G;;\n').encode('utf-8')
+
+
+def test_find_csv_data_start():
+    start = MetObsClient._find_csv_data_start(_csv_hour, 'Datum;Tid (UTC)')
+    assert _csv_hour[start:].startswith(b'Datum;Tid (UTC);Lufttemperatur')
+    assert MetObsClient._find_csv_data_start(b'Datum;Tid (UTC);x\n', 'Datum;Tid (UTC)') == 0
+    assert MetObsClient._find_csv_data_start(_csv_hour, 'Representativt dygn') is None
+
+
+def test_csv_to_dataframe(offline_client):
+    obs_s, aux_df, station_name, md_str = offline_client._csv_to_dataframe(
+        codecs.BOM_UTF8 + _csv_hour, ParametersMetObs.TemperatureAirHour)
+
+    assert station_name == 'Hoburg A'
+    assert md_str.startswith('Stationsnamn;Stationsnummer')
+    assert md_str.endswith('degree celsius\n\n')
+    assert obs_s.tolist() == [1.5, -0.5, 2.0]
+    assert obs_s.index[1] == pd.Timestamp('2020-01-01 01:00')
+    assert aux_df['quality'].tolist() == ['G', 'Y', 'G']
+
+
+# notes in the extra columns of the first rows only, the other rows have fewer fields
+_csv_hour_ragged = _csv_hour.replace(b';;\n', b'\n') + (b'2020-01-01;03:00:00;3.0;G\n'
+                                                        b'2020-01-01;04:00:00;;G\n')
+
+
+def test_csv_engines_ragged(offline_client):
+    pytest.importorskip('pyarrow')
+    pyarrow_client = MetObsClient(csv_engine='pyarrow',
+                                  api_parameters={'1': {'title': 'Lufttemperatur', 'summary': ''}})
+    obs_c, aux_c, _, _ = offline_client._csv_to_dataframe(_csv_hour_ragged, ParametersMetObs.TemperatureAirHour)
+    obs_pa, aux_pa, _, _ = pyarrow_client._csv_to_dataframe(_csv_hour_ragged, ParametersMetObs.TemperatureAirHour)
+
+    assert obs_pa.tolist()[:4] == [1.5, -0.5, 2.0, 3.0] and np.isnan(obs_pa.iloc[4])
+    pd.testing.assert_series_equal(obs_pa, obs_c)
+    pd.testing.assert_frame_equal(aux_pa, aux_c, check_categorical=False)
+    assert isinstance(aux_pa['quality'].dtype, pd.CategoricalDtype)
+
+
+def test_json_to_dataframe(offline_client):
+    api_json = {'value': [{'date': 1577836800000, 'value': '1.5', 'quality': 'G'},
+                          {'date': 1577840400000, 'value': '-0.5', 'quality': 'Y'},
+                          {'date': 1577844000000, 'value': '2.0', 'quality': 'G'}],
+                'station': {'name': 'Hoburg A'},
+                'parameter': {'key': '1'}}
+    obs_s, aux_df, station_name, md_str = offline_client._json_to_dataframe(
+        api_json, ParametersMetObs.TemperatureAirHour)
+
+    assert station_name == 'Hoburg A'
+    assert obs_s.dtype == 'float64'
+    assert obs_s.tolist() == [1.5, -0.5, 2.0]
+    assert obs_s.index[1] == pd.Timestamp('2020-01-01 01:00')
+    assert isinstance(aux_df['quality'].dtype, pd.CategoricalDtype)
+    assert aux_df['quality'].tolist() == ['G', 'Y', 'G']
+
+    # daily values are referenced by 'ref' date
+    api_json['value'] = [{'from': 1577836800000, 'to': 1577923200000, 'ref': '2020-01-01',
+                          'value': '3.5', 'quality': 'G'}]
+    obs_s, aux_df, _, _ = offline_client._json_to_dataframe(api_json,
+                                                            ParametersMetObs.TemperatureAirDay)
+    assert obs_s.index.tolist() == [pd.Timestamp('2020-01-01')]
+    assert obs_s.tolist() == [3.5]
+    assert set(aux_df.columns) == {'from', 'to', 'quality'}
+
+    # stations without data in the period return value null
+    api_json['value'] = None
+    obs_s, aux_df, _, _ = offline_client._json_to_dataframe(api_json,
+                                                            ParametersMetObs.TemperatureAirHour)
+    assert obs_s.empty
+    assert aux_df.empty
+
+
+@pytest.mark.parametrize("use_orjson", [False, True])
+def test_loads_json(monkeypatch, use_orjson):
+    from sondera.clients.smhi import common
+
+    if use_orjson:
+        monkeypatch.setattr(common, 'orjson', pytest.importorskip('orjson'))
+    else:
+        monkeypatch.setattr(common, 'orjson', None)
+
+    content = '{"station": {"name": "Hoburg A"}, "value": [{"value": "1.5"}]}'.encode('utf-8')
+    assert common._loads_json(content) == {'station': {'name': 'Hoburg A'},
+                                           'value': [{'value': '1.5'}]}
+
+
+def test_get_observations_batch(api_client):
+    results, errors = api_client.get_observations_batch([(159880, 2, 'latest-months'),
+                                                         (68560, ParametersMetObs.TemperatureAirDay,
+                                                          'latest-months'),
+                                                         (159880, 1, 'latest-day'),
+                                                         (159880, 1, 'not-a-period')])
+    assert len(results[(159880, ParametersMetObs.TemperatureAirDay, 'latest-months')].data) > 0
+    assert len(results[(68560, ParametersMetObs.TemperatureAirDay, 'latest-months')].data) > 0
+    assert len(results[(159880, ParametersMetObs.TemperatureAirHour, 'latest-day')].data) > 0
+    assert isinstance(errors[(159880, ParametersMetObs.TemperatureAirHour, 'not-a-period')], APIError)
+    assert (159880, ParametersMetObs.TemperatureAirHour, 'not-a-period') not in results
+
+
+def test_get_observations_batch_errors(offline_client, monkeypatch):
+    def get_observations(parameter, station, period):
+        if station == 1:
+            raise KeyError('value')
+        if station == 2:
+            raise TypeError('unexpected payload')
+        return station
+
+    monkeypatch.setattr(offline_client, 'get_observations', get_observations)
+    results, errors = offline_client.get_observations_batch([(1, 1, 'latest-day'),
+                                                             (2, 1, 'latest-day'),
+                                                             (3, 1, 'latest-day')], max_workers=6)
+    assert results == {(3, ParametersMetObs.TemperatureAirHour, 'latest-day'): 3}
+    assert isinstance(errors[(1, ParametersMetObs.TemperatureAirHour, 'latest-day')], KeyError)
+    assert isinstance(errors[(2, ParametersMetObs.TemperatureAirHour, 'latest-day')], TypeError)
+
+
+def test_csv_engine_pyarrow():
+    pytest.importorskip('pyarrow')
+    client = MetObsClient(csv_engine='pyarrow')
+    api_data = client.get_observations(1, 68560, 'corrected-archive')
+    assert len(api_data.data) > 0
+    assert pd.api.types.is_float_dtype(api_data.data)
+    assert isinstance(api_data.aux_data['quality'].dtype, pd.CategoricalDtype)
+
+
+def test_refresh_observations(api_client):
+    api_data = api_client.get_observations(1, 98230, 'latest-months')
+    n_obs = len(api_data.data)
+    api_data.data = api_data.data.iloc[:-10]
+    api_data.aux_data = api_data.aux_data.iloc[:-10]
+
+    api_client.refresh_observations(api_data)
+    assert len(api_data.data) >= n_obs
+    assert not api_data.data.index.duplicated().any()
+    assert api_data.data.index.is_monotonic_increasing
+
+
+def test_refresh_observations_empty(api_client):
+    api_data = api_client.get_observations(2, 159880, 'latest-months')
+    api_data.data = api_data.data.iloc[:0]
+    api_data.aux_data = api_data.aux_data.iloc[:0]
+
+    # no previous data, the full series is downloaded
+    api_client.refresh_observations(api_data)
+    assert api_data.data.index.min() < pd.Timestamp.now('UTC').tz_localize(None) - pd.Timedelta(days=365)
+
+
+def test_get_observations_range_tz(offline_client, monkeypatch):
+    index = pd.date_range('2020-01-01', periods=48, freq='h')
+    archive = types.SimpleNamespace(data=pd.Series(1.0, index=index),
+                                    aux_data=pd.DataFrame({'quality': 'G'}, index=index))
+    monkeypatch.setattr(offline_client, 'get_observations', lambda parameter, station, period: archive)
+
+    # tz-aware start and end are converted to naive UTC as the index
+    api_data = offline_client.get_observations_range(1, 98230, '2020-01-01T06:00Z',
+                                                     pd.Timestamp('2020-01-01 13:00', tz='Europe/Stockholm'))
+    assert api_data.data.index[0] == pd.Timestamp('2020-01-01 06:00')
+    assert api_data.data.index[-1] == pd.Timestamp('2020-01-01 12:00')
+
+
+@pytest.mark.parametrize("start, end", [
+    (pd.Timestamp.now('UTC').tz_localize(None) - pd.Timedelta(hours=12), None),
+    (pd.Timestamp.now('UTC').tz_localize(None) - pd.Timedelta(days=30), None),
+    ('2015-01-01', '2016-12-31'),
+])
+def test_get_observations_range(api_client, start, end):
+    api_data = api_client.get_observations_range(1, 98230, start, end)
+    assert len(api_data.data) > 0
+    assert api_data.data.index.min() >= pd.Timestamp(start)
+    if end is not None:
+        assert api_data.data.index.max() <= pd.Timestamp(end)
+
+
+def test_get_periods(api_client):
+    periods = api_client.get_periods(2, 159880)
+    assert 'corrected-archive' in periods
+    assert 'latest-months' in periods
+    assert api_client.get_periods(ParametersMetObs.TemperatureAirDay, 159880) == periods
+
+
+def test_get_station_catalog(api_client, tmp_path):
+    catalog = api_client.get_station_catalog(parameters=[1, 2], max_workers=2)
+    assert set(catalog['parameter']) == {1, 2}
+    assert pd.api.types.is_datetime64_any_dtype(catalog['updated'])
+
+    path = tmp_path / 'catalog.parquet'
+    api_client.save_station_catalog(catalog, path)
+    pd.testing.assert_frame_equal(api_client.load_station_catalog(path), catalog)
+
+    stations = api_client.stations_from_catalog(catalog[catalog['id'] == 98230])
+    assert stations[98230].id == 98230
@@ -3,6 +3,7 @@ import pytest
 
 from sondera.clients.smhi import ParametersStrang
 from sondera.clients.smhi import StrangClient
+from sondera.clients.smhi import smhistrang
 
 
 @pytest.fixture(scope="module")
@@ -34,6 +35,119 @@ def test_point_valid(api_client, parameter):
     assert len(api_data) > 0
 
 
+def test_data_points(api_client):
+    points = {'a': (16.158, 58.5812), 'b': (18.06, 59.33)}
+    data, errors = api_client.get_data_points(parameter=[116, 117],
+                                              points=points,
+                                              date_from='2022-06-01 01:00',
+                                              date_to='2022-06-02 21:00',
+                                              agg_interval='hourly')
+
+    assert not errors
+    assert list(data.columns) == [('CIEUVIrradiance', 'a'), ('CIEUVIrradiance', 'b'),
+                                  ('GlobalIrradiance', 'a'), ('GlobalIrradiance', 'b')]
+    assert len(data) > 0
+
+
+def test_point_windows(api_client):
+    kwargs = dict(parameter=117, lon=16.158, lat=58.5812,
+                  date_from='2021-01-01', date_to='2021-03-31', agg_interval='daily')
+    api_data = api_client.get_data_point(window='20D', **kwargs)
+
+    assert api_data.index.is_monotonic_increasing
+    assert api_data.index.is_unique
+    pd.testing.assert_series_equal(api_data, api_client.get_data_point(window=None, **kwargs))
+
+
+def _utc(date):
+    return pd.Timestamp(date, tz='UTC')
+
+
+def test_split_date_range():
+    # calendar years, windows do not overlap
+    windows = smhistrang._split_date_range('2000-06-15T10:30', '2002-02-01', 'YS', 'hourly')
+    assert windows == [(_utc('2000-06-15 10:30'), _utc('2000-12-31 23:00')),
+                       (_utc('2001-01-01'), _utc('2001-12-31 23:00')),
+                       (_utc('2002-01-01'), _utc('2002-02-01'))]
+
+    # a day, or month, is not split between windows. Mixed tz-aware and naive dates
+    windows = smhistrang._split_date_range('2020-01-01T05:00:00Z', pd.Timestamp('2020-02-01'), '20D', 'daily')
+    assert windows[0][1] == _utc('2020-01-20 23:00')
+    assert windows[1][0] == _utc('2020-01-21')
+    windows = smhistrang._split_date_range('2020-01-05', '2020-12-01', '90D', 'monthly')
+    assert all(start.day == 1 for start, _ in windows[1:])
+
+    assert smhistrang._split_date_range('2020-01-01', '2020-06-01', 'YS', 'hourly') == [('2020-01-01', '2020-06-01')]
+
+
+def test_exact_key_cache(monkeypatch):
+    requested = []
+
+    class Response:
+        def json(self):
+            return [{'date_time': '2021-01-01T00:00:00Z', 'value': 1.0}]
+
+    def make_request(url, transport=None):
+        requested.append(url)
+        return Response()
+
+    monkeypatch.setattr(smhistrang, '_make_request', make_request)
+    client = StrangClient()
+    kwargs = dict(parameter=117, date_from='2021-01-01', date_to='2021-01-02', agg_interval='daily')
+
+    # identical points share one request, also in later calls
+    data, errors = client.get_data_points(points={'a': (16.158, 58.5812), 'b': (16.158, 58.5812)}, **kwargs)
+    assert list(data.columns) == ['a', 'b'] and errors == {}
+    client.get_data_point(lon=16.158, lat=58.5812, **kwargs)
+    assert len(requested) == 1
+
+    # no snapping, any other coordinate is a new request
+    client.get_data_point(lon=16.159, lat=58.5812, **kwargs)
+    assert len(requested) == 2
+
+    client.clear_cache()
+    client.get_data_point(lon=16.158, lat=58.5812, **kwargs)
+    assert len(requested) == 3
+
+
+def test_snap_to_grid(monkeypatch):
+    requested = []
+
+    class Response:
+        def __init__(self, url):
+            self.url = url
+
+        def json(self):
+            if self.url.endswith('/multipoint.json'):
+                # 0.1 degree grid
+                return {'coordinates': [[lon, lat] for lon in (16.0, 16.1, 16.2) for lat in (58.5, 58.6)]}
+            return [{'date_time': '2021-01-01T00:00:00Z', 'value': 1.0}]
+
+    def make_request(url, transport=None):
+        requested.append(url)
+        return Response(url)
+
+    monkeypatch.setattr(smhistrang, '_make_request', make_request)
+    monkeypatch.setattr(smhistrang, '_grid_cache', {})
+    client = StrangClient(snap_to_grid=True)
+    assert client.nearest_grid_point(16.08, 58.53) == (16.1, 58.5)
+    # outside the grid
+    assert client.nearest_grid_point(20.0, 65.0) == (20.0, 65.0)
+
+    data, errors = client.get_data_points(117, {'a': (16.08, 58.53), 'b': (16.12, 58.47), 'c': (16.0, 58.6)},
+                                          '2021-01-01', '2021-01-02', 'daily')
+    assert list(data.columns) == ['a', 'b', 'c'] and errors == {}
+    # a and b in the same grid cell share one request, the grid is downloaded once
+    point_urls = [url for url in requested if '/point/' in url]
+    assert len(point_urls) == 2
+    assert len(requested) == 3
+    assert any('/lon/16.1/lat/58.5/' in url for url in point_urls)
+
+    # cached for the grid point
+    client.get_data_point(117, 16.11, 58.52, '2021-01-01', '2021-01-02', 'daily')
+    assert len(requested) == 3
+
+
 def test_point_datetime():
     pass
 
@@ -7,5 +7,256 @@ Tests TODO:
 
 """
 
+import json
+import os
+import subprocess
+import sys
+
+import geopandas
+import numpy as np
+import pandas as pd
 import pytest
+from shapely.geometry import box
+
+from sondera.datatypes import (Coordinate, DataPanel, DataSeries, Station, StationType,
+                               compact_dataframe)
+from sondera.geo_utils import (StationIndex, find_nearby_stations, find_stations_in_polygon,
+                               distance_haversine, haversine_distances, euclidean_distances,
+                               transform_coordinates)
+from sondera.clients import Transport, DiskCache
+from sondera.clients.smhi import StrangClient
+from sondera.clients.sgu import GroundwaterLevelsClient
+
+
+def test_shared_default_transport():
+    assert StrangClient().transport is GroundwaterLevelsClient().transport
+
+
+def test_injected_transport():
+    with Transport(pool_maxsize=4, timeout=5) as transport:
+        client = StrangClient(transport=transport)
+        assert client.transport is transport
+        assert client.transport.timeout == 5
+
+
+def test_ensure_pool_maxsize():
+    transport = Transport(pool_maxsize=4)
+    transport.ensure_pool_maxsize(24)
+    assert transport.session.get_adapter('https://opendata.smhi.se')._pool_maxsize == 24
+    transport.ensure_pool_maxsize(8)
+    assert transport.session.get_adapter('https://opendata.smhi.se')._pool_maxsize == 24
+
+
+def test_disk_cache(tmp_path):
+    cache = DiskCache(tmp_path, ttl={'latest-hour': 0})
+    url = 'https://example.com/parameter/1/station/1/period/latest-hour/data.json'
+    cache.set(url, {'ETag': '"abc"', 'Server': 'x'}, b'{"value": []}', 'utf-8')
+
+    header, body = cache.get(url)
+    assert body == b'{"value": []}'
+    assert header['headers'] == {'ETag': '"abc"'}
+    assert not cache.is_fresh(url, header)
+    assert cache.ttl_for(url.replace('latest-hour', 'corrected-archive')) > 0
+
+    response = cache.to_response(url, header, body)
+    assert response.json() == {'value': []}
+
+
+def test_disk_cache_eviction(tmp_path):
+    cache = DiskCache(tmp_path, max_size=0)
+    cache.set('https://example.com/a.json', {}, b'a' * 1000)
+    assert cache.get('https://example.com/a.json') is None
+    assert cache.size() == 0
+
+
+def test_disk_cache_revalidated(tmp_path):
+    cache = DiskCache(tmp_path, default_ttl=60)
+    url = 'https://example.com/station.json'
+    cache.set(url, {}, b'{}')
+    path = cache._path(url)
+    os.utime(path, (0, 0))
+
+    header, _ = cache.get(url)
+    assert not cache.is_fresh(url, header)
+    # read time is kept separate from the stored time
+    assert os.stat(path).st_atime > 0 and os.stat(path).st_mtime == 0
+
+    cache.revalidated(url)
+    header, body = cache.get(url)
+    assert cache.is_fresh(url, header) and body == b'{}'
+
+
+def test_disk_cache_size_estimate(tmp_path):
+    cache = DiskCache(tmp_path, max_size=5000)
+    scans = []
+    entries = cache._entries
+    cache._entries = lambda: scans.append(1) or entries()
+    for name in 'abcde':
+        cache.set(f'https://example.com/{name}.json', {}, os.urandom(1000))
+        os.utime(cache._path(f'https://example.com/{name}.json'), (ord(name), ord(name)))
+    # least recently used are evicted once the estimate crosses max_size
+    assert cache.get('https://example.com/a.json') is None
+    assert cache.get('https://example.com/e.json') is not None
+    # one scan for the initial size, then only when the estimate crossed max_size
+    assert len(scans) == 2
+    assert cache.size() <= 5000
+
+
+def test_station_index():
+    catalog = pd.DataFrame({'id': [1, 2, 3],
+                            'latitude': [59.33, 57.71, 55.60],
+                            'longitude': [18.07, 11.97, 13.00]})
+    index = StationIndex(catalog)
+
+    nearest = index.query(Coordinate(y=59.0, x=18.0, epsg_xy=4326), k=2)
+    assert list(nearest['id']) == [1, 2]
+    assert nearest['distance'].iloc[0] == pytest.approx(36900, rel=0.01)
+
+    within = find_nearby_stations(index, Coordinate(y=57.7, x=12.0, epsg_xy=4326), radius=300000)
+    assert list(within['id']) == [2, 3]
+
+    with pytest.raises(TypeError):
+        index.query((59.0, 18.0))
+
+
+def test_sgu_station_catalog():
+    # transposed as from GroundwaterLevelsClient.get_all_stations_lan, X northing and Y easting
+    stations_lan = pd.DataFrame({'1_1': {'X': 6580000.0, 'Y': 674000.0, 'code': '1_1'},
+                                 '2_1': {'X': 6400000.0, 'Y': 320000.0, 'code': '2_1'}})
+    catalog = GroundwaterLevelsClient.station_catalog_from_lan(stations_lan)
+
+    assert list(catalog['id']) == ['1_1', '2_1']
+    assert catalog['latitude'].tolist() == pytest.approx([59.323, 57.706], abs=0.001)
+    assert catalog['longitude'].tolist() == pytest.approx([18.058, 11.979], abs=0.001)
+
+    index = StationIndex.from_catalogs(catalog)
+    nearest = index.query(Coordinate(y=59.3, x=18.0, epsg_xy=4326), k=1)
+    assert list(nearest['id']) == ['1_1']
+
+
+def test_find_stations_in_polygon():
+    catalog = pd.DataFrame({'id': [1, 2, 3],
+                            'latitude': [59.33, 57.71, 55.60],
+                            'longitude': [18.07, 11.97, 13.00]})
+    polygons = geopandas.GeoSeries([box(11, 55, 14, 58), box(20, 60, 21, 61)],
+                                   index=['south', 'north'], crs=4326).to_crs(3006)
+
+    assert find_stations_in_polygon(catalog, polygons) == {'south': [2, 3], 'north': []}
+
+
+def test_distance_matrices():
+    coords = [Coordinate(y=59.33, x=18.07, epsg_xy=4326),
+              Coordinate(y=57.71, x=11.97, epsg_xy=4326),
+              Coordinate(y=55.60, x=13.00, epsg_xy=4326)]
+
+    distances = haversine_distances(coords, chunk_size=2)
+    assert distances.shape == (3, 3)
+    assert np.allclose(np.diag(distances), 0)
+    assert distances[0, 1] == pytest.approx(distance_haversine(coords[0], coords[1]), rel=1e-6)
+    assert np.allclose(haversine_distances([[59.33, 18.07]], [[57.71, 11.97], [55.60, 13.00]]),
+                       distances[[0], 1:])
+
+    # DataFrame rows, and Coordinates in other CRS converted to WGS84
+    catalog = pd.DataFrame({'latitude': [59.33, 57.71, 55.60], 'longitude': [18.07, 11.97, 13.00]})
+    assert np.allclose(haversine_distances(catalog[['latitude', 'longitude']]), distances)
+    mixed_crs = transform_coordinates(coords[:1], 3006) + coords[1:]
+    assert np.allclose(haversine_distances(mixed_crs), distances, atol=0.01)
+
+    distances = euclidean_distances([[0, 0], [3, 4]], [[0, 0], [6, 8], [3, 4]], chunk_size=1)
+    assert np.allclose(distances, [[0, 10, 5], [5, 5, 0]])
+
+
+def test_transform_coordinates():
+    sweref = Coordinate(y=6580000, x=674000, z=3, epsg_xy=3006)
+    wgs84 = sweref.to_wgs84()
+    assert (wgs84.y, wgs84.x) == pytest.approx((59.3229, 18.0580), abs=1e-4)
+    assert wgs84.z == 3
+    assert wgs84.to_wgs84() is wgs84
+
+    coords = transform_coordinates([wgs84, sweref], epsg_out=3006)
+    assert [c.epsg_xy for c in coords] == [3006, 3006]
+    assert (coords[0].y, coords[0].x) == pytest.approx((sweref.y, sweref.x), abs=1e-3)
+
+
+def test_import_time():
+    # run in a fresh interpreter, the test session has already imported everything
+    # pandas is imported first as baseline, only the time on top of it is sondera's own
+    code = ("import sys, time, json; t = time.perf_counter(); import pandas; "
+            "t_pandas = time.perf_counter() - t; t = time.perf_counter(); import sondera.clients.smhi; "
+            "print(json.dumps([t_pandas, time.perf_counter() - t, "
+            "[m for m in ('geopandas', 'pyproj', 'shapely', 'scipy', 'tqdm') if m in sys.modules]]))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    pandas_time, import_time, heavy_modules = json.loads(output.stdout)
+
+    assert heavy_modules == []
+    # about 0.1 s here, allow for slow machines but not for a heavy import slipping in
+    assert import_time < max(0.5, pandas_time)
+
+
+def test_compact_station():
+    positions = [{'from': pd.Timestamp('1990-01-01'), 'to': pd.Timestamp('2000-01-01'),
+                  'position': Coordinate(y=59.0, x=18.0, z=10.0, epsg_xy=4326, epsg_z=5613)},
+                 {'from': pd.Timestamp('2000-01-01'), 'to': pd.Timestamp('2020-01-01'),
+                  'position': Coordinate(y=59.1, x=18.0, epsg_xy=4326, epsg_z=5613)}]
+    station = Station(name='Station', id=1, agency='SMHI', position=positions[-1]['position'],
+                      station_type=StationType.MetStation, active_station=True,
+                      active_period=[pd.Timestamp('1990-01-01'), pd.Timestamp('2020-01-01')],
+                      last_updated=pd.Timestamp('2020-01-01'), station_info={},
+                      position_history=positions)
+
+    compact = station.to_compact()
+    assert {compact: 1}[station.to_compact()] == 1
+    assert len(compact.position_history) == 2
+    assert compact.position.to_wgs84() is compact.position
+    assert compact.to_station() == station
+
+
+def test_compact_dataframe():
+    aux_df = pd.DataFrame({'quality': ['G', 'Y', 'G', 'G'],
+                           'from': [1.6e12, 1.6e12 + 3.6e6, None, 1.6e12 + 7.2e6],
+                           'Till Datum Tid (UTC)': pd.Categorical(['2020-01-01 06:00:01', None,
+                                                                   '2020-01-01 06:00:01',
+                                                                   '2020-01-02 06:00:01']),
+                           'level': [1.0, 2.0, 3.0, 4.0]})
+    compact = compact_dataframe(aux_df, float32=True)
+
+    assert isinstance(compact['quality'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(compact['from'])
+    assert compact['Till Datum Tid (UTC)'].isna().tolist() == [False, True, False, False]
+    assert compact['Till Datum Tid (UTC)'].iloc[3] == pd.Timestamp('2020-01-02 06:00:01')
+    assert compact['level'].dtype == 'float32'
+
+    data_series = DataSeries(station=None, data=pd.Series([1.0, 2.0, 3.0, 4.0]), parameter=None,
+                             metadata='', start_date=None, end_date=None, aux_data=aux_df)
+    compact_series = data_series.to_compact(float32=True)
+    assert compact_series.data.dtype == 'float32'
+    assert compact_series.memory_usage() < data_series.memory_usage()
+
+
+def test_data_panel():
+    def data_series(station_id, start, periods):
+        station = Station(name=str(station_id), id=station_id, agency='SMHI',
+                          position=Coordinate(y=59.0, x=18.0, epsg_xy=4326),
+                          station_type=StationType.MetStation, active_station=True,
+                          active_period=[None, None], last_updated=None, station_info={})
+        data = pd.Series(np.arange(periods, dtype='float64'),
+                         index=pd.date_range(start, periods=periods, freq='h'))
+        return DataSeries(station=station, data=data, parameter=None, metadata='',
+                          start_date=data.index[0], end_date=data.index[-1])
+
+    series = [data_series(1, '2020-01-01', 48), data_series(2, '2020-01-02', 48),
+              data_series(3, '2020-01-01', 24)]
+
+    panel = DataPanel.from_data_series(series)
+    assert panel.shape == (72, 3)
+    pd.testing.assert_frame_equal(panel.to_frame(),
+                                  pd.concat([s.data.rename(s.station.id) for s in series], axis=1),
+                                  check_names=False)
+
+    selection = panel.sel('2020-01-02', '2020-01-02 23:00', stations=[1, 2])
+    assert selection.shape == (24, 2)
+    assert np.shares_memory(selection.values, panel.values)
+    assert list(selection.stations['name']) == ['1', '2']
 
+    assert DataPanel.from_data_series(series, index='intersection').shape == (0, 3)
+    assert DataPanel.from_data_series(series, freq='1D', how='sum').shape == (3, 3)
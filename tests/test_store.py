@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+from sondera.clients.smhi import MetObsClient, ParametersMetObs, ParametersStrang, StrangClient
+from sondera.datatypes import Coordinate, DataSeries, Station, StationType
+
+pytest.importorskip('pyarrow')
+from sondera.store import ParquetStore  # noqa: E402
+
+
+def _data_series(index):
+    station = Station(name='Test', id=1, agency='SMHI',
+                      position=Coordinate(y=59.0, x=18.0, epsg_xy=4326),
+                      station_type=StationType.MetStation, active_station=True,
+                      active_period=[index[0], index[-1]], last_updated=index[-1],
+                      station_info={})
+    return DataSeries(station=station,
+                      data=pd.Series(range(len(index)), index=index, dtype=float),
+                      aux_data=pd.DataFrame({'quality': 'G'}, index=index),
+                      parameter=ParametersMetObs.TemperatureAirHour,
+                      metadata='',
+                      start_date=index[0],
+                      end_date=index[-1])
+
+
+def test_write_read(tmp_path):
+    store = ParquetStore(tmp_path)
+    index = pd.date_range('2020-01-01', periods=48, freq='h', name='timestamp')
+
+    assert store.write(_data_series(index[:24])) == 24
+    # only new observations are appended
+    assert store.write(_data_series(index)) == 24
+
+    api_data = store.read('smhi-metobs', ParametersMetObs.TemperatureAirHour)['1']
+    assert len(api_data.data) == 48
+    assert api_data.station.position == Coordinate(y=59.0, x=18.0, epsg_xy=4326)
+    assert list(api_data.aux_data.columns) == ['quality']
+
+    api_data = store.read('smhi-metobs', 'TemperatureAirHour', stations=[1],
+                          start='2020-01-02 00:00', end='2020-01-02 05:00')['1']
+    assert len(api_data.data) == 6
+    assert store.last_timestamp('smhi-metobs', 'TemperatureAirHour', 1) == index[-1]
+
+
+def test_sync(tmp_path):
+    store = ParquetStore(tmp_path)
+    client = MetObsClient()
+    assert store.sync(client, 1, 98230) > 0
+    n_stored = len(store.read('smhi-metobs', 'TemperatureAirHour', [98230])['98230'].data)
+    store.sync(client, 1, 98230)
+    api_data = store.read('smhi-metobs', 'TemperatureAirHour', [98230])['98230']
+    assert len(api_data.data) >= n_stored
+    assert api_data.data.index.is_unique
+
+
+def test_sync_strang(tmp_path, monkeypatch):
+    from urllib.parse import parse_qs, urlsplit
+
+    class Response:
+        def __init__(self, url):
+            query = parse_qs(urlsplit(url).query.lstrip('?'))
+            self.index = pd.date_range(query['from'][0], query['to'][0], freq='h')
+
+        def json(self):
+            # Strång timestamps end in Z
+            return [{'date_time': t.strftime('%Y-%m-%dT%H:%M:%SZ'), 'value': float(t.hour)}
+                    for t in self.index]
+
+    monkeypatch.setattr('sondera.clients.smhi.smhistrang._make_request',
+                        lambda url, transport=None: Response(url))
+    store = ParquetStore(tmp_path)
+    client = StrangClient()
+    date_from = pd.Timestamp.now('UTC').tz_localize(None).floor('h') - pd.Timedelta(hours=48)
+
+    assert store.sync_strang(client, 116, 16.158, 58.5812, 'hourly', date_from) == 49
+    # continues from the last stored, tz-aware, timestamp. One new value if the hour changed
+    assert store.sync_strang(client, 116, 16.158, 58.5812, 'hourly', date_from) <= 1
+
+    data_series = store.read_strang(ParametersStrang.CIEUVIrradiance, 16.158, 58.5812, 'hourly',
+                                    start=date_from + pd.Timedelta(hours=24),
+                                    end=date_from + pd.Timedelta(hours=30))
+    assert len(data_series) == 7
+    assert str(data_series.index.tz) == 'UTC'